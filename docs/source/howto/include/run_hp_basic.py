@@ -3,6 +3,7 @@
 """Example running a pw.x and hp.x in a squence."""
 from aiida.engine import run
 from aiida.orm import Dict, KpointsData, StructureData, load_code, load_group
+from aiida.orm.nodes.data.structure import Kind, Site
 from aiida_quantumespresso.data.hubbard_structure import HubbardStructureData
 
 # =================================================== #
@@ -23,8 +24,11 @@ cell = [[a, -b, c], [0.0, d, c], [-a, -b, c]]
 positions = [[0, 0, 0], [0, 0, 3.6608], [0, 0, 10.392], [0, 0, 7.0268]]
 symbols = ['Co', 'O', 'O', 'Li']
 structure = StructureData(cell=cell)
+# Define each kind only once, then add the sites: this avoids that the kinds are validated for every single atom
+for symbol in dict.fromkeys(symbols):
+    structure.append_kind(Kind(symbols=symbol, name=symbol))
 for position, symbol in zip(positions, symbols):
-    structure.append_atom(position=position, symbols=symbol)
+    structure.append_site(Site(kind_name=symbol, position=position))
 
 # Create a structure data with Hubbard parameters
 hubbard_structure = HubbardStructureData.from_structure(structure)
@@ -2,6 +2,7 @@
 """Calculation function to relabel the kinds of a Hubbard structure."""
 from __future__ import annotations
 
+from collections import defaultdict
 from copy import deepcopy
 
 from aiida.engine import calcfunction
@@ -39,18 +40,18 @@ def structure_relabel_kinds(
         for site in hubbard['sites']:
             new_magnetization.pop(site['kind'], None)
 
+    kinds_by_name = {kind.name: kind for kind in hubbard_structure.kinds}
     kind_set = hubbard_structure.get_site_kindnames()
-    symbol_set = [hubbard_structure.get_kind(kind_name).symbol for kind_name in kind_set]
-    symbol_counter = {key: 0 for key in hubbard_structure.get_symbols_set()}
+    symbol_set = [kinds_by_name[kind_name].symbol for kind_name in kind_set]
+    symbol_counter = defaultdict(int)
+
+    # We define a `spin_type`, since ``hp.x`` does not distinguish new types according to spin
+    spin_types = [str(int(site['new_type']) * int(site['spin'])) for site in hubbard['sites']]
 
     # First do the Hubbard sites, popping the kind name suffix each time a new type is encountered. We do the suffix
     # generation ourselves, because the indexing done by hp.x contains gaps in the sequence.
-    for index, site in enumerate(hubbard['sites']):
-        symbol = symbol_set[index]
-
+    for index, (site, spin_type, symbol) in enumerate(zip(hubbard['sites'], spin_types, symbol_set)):
         try:
-            # We define a `spin_type`, since ``hp.x`` does not distinguish new types according to spin
-            spin_type = str(int(site['new_type']) * int(site['spin']))
             kind_name = type_to_kind[spin_type]
         except KeyError:
             kind_name = get_relabelled_symbol(symbol, symbol_counter[symbol])
@@ -68,9 +69,8 @@ def structure_relabel_kinds(
 
     # Now add the non-Hubbard sites
     for site in sites[len(relabeled.sites):]:
-        symbols = hubbard_structure.get_kind(site.kind_name).symbols
-        names = hubbard_structure.get_kind(site.kind_name).name
-        relabeled.append_atom(position=site.position, symbols=symbols, name=names)
+        kind = kinds_by_name[site.kind_name]
+        relabeled.append_atom(position=site.position, symbols=kind.symbols, name=kind.name)
 
     outputs = {'hubbard_structure': relabeled}
     if magnetization:
@@ -17,6 +17,29 @@ PwCalculation = CalculationFactory('quantumespresso.pw')
 HubbardStructureData = DataFactory('quantumespresso.hubbard_structure')
 
 
+def _normalize_namelists(parameters: dict) -> dict:
+    """Return a copy of ``parameters`` with uppercase namelist names and lowercase flags.
+
+    This is equivalent to calling ``_uppercase_dict`` on the namelists followed by ``_lowercase_dict`` on each of them,
+    but it traverses the top level dictionary only once. Namelists whose flags are already lowercase, which is the
+    common case, are not copied.
+    """
+    result = {}
+
+    for key, value in parameters.items():
+        namelist = str(key).upper()
+        if isinstance(value, dict) and all(isinstance(flag, str) and flag == flag.lower() for flag in value):
+            result[namelist] = value
+        else:
+            result[namelist] = _lowercase_dict(value, dict_name=namelist)
+
+    if len(result) != len(parameters):
+        # Some namelists are repeated when compared case-insensitively: let ``_uppercase_dict`` raise accordingly
+        _uppercase_dict(parameters, dict_name='parameters')
+
+    return result
+
+
 def validate_parent_scf(parent_scf, _):
     """Validate the `parent_scf` input.
 
@@ -38,22 +61,24 @@ def validate_parent_scf(parent_scf, _):
 def validate_parent_hp(parent_hp, _):
     """Validate the `parent_hp` input.
 
-    Each entry in the `parent_hp` mapping should be a retrieved folder of a `HpCalculation`.
+    Each entry in the `parent_hp` mapping should be a retrieved folder of a `HpCalculation`. The first invalid entry
+    that is encountered is returned as the error message, without inspecting the remaining ones.
     """
+    process_class = HpCalculation
+
     for label, retrieved in parent_hp.items():
         creator = retrieved.creator
 
-        if not creator:
+        if creator is None:
             return f'could not determine the creator of {retrieved}'
 
-        if creator.process_class is not HpCalculation:
+        if creator.process_class is not process_class:
             return f'creator of `parent_hp.{label}` {creator} is not a `HpCalculation`'
 
 
 def validate_parameters(parameters, _):
     """Validate the `parameters` input."""
-    result = _uppercase_dict(parameters.get_dict(), dict_name='parameters')
-    result = {key: _lowercase_dict(value, dict_name=key) for key, value in result.items()}
+    result = _normalize_namelists(parameters.get_dict())
 
     # Check that required namelists are present
     for namelist in HpCalculation.compulsory_namelists:
@@ -121,9 +146,27 @@ class HpCalculation(CalcJob):
     compulsory_namelists = ['INPUTHP']
     prefix = 'aiida'
 
+    # Output file and directory names, computed once here instead of at every access of the class properties
+    _filename_output_hubbard_chi = f'{prefix}.chi.dat'
+    _filename_output_hubbard = f'{prefix}.Hubbard_parameters.dat'
+    _dirname_output = 'out'
+    _dirname_output_hubbard = os.path.join(_dirname_output, 'HP')
+    _dirname_output_scf = os.path.join(_dirname_output, f'{prefix}.save')
+    _filepath_output_hubbard_chi = os.path.join(_dirname_output_hubbard, _filename_output_hubbard_chi)
+    _filepath_output_perturbations = os.path.join(_dirname_output_hubbard, f'{prefix}.*.pert_*.dat')
+
     # Not using symlink of pw folder to allow multiple hp to run on top of the same folder
     _default_symlink_usage = False
 
+    def __init_subclass__(cls, **kwargs):
+        """Recompute the output file and directory names that depend on the ``prefix`` of the subclass."""
+        super().__init_subclass__(**kwargs)
+        cls._filename_output_hubbard_chi = f'{cls.prefix}.chi.dat'
+        cls._filename_output_hubbard = f'{cls.prefix}.Hubbard_parameters.dat'
+        cls._dirname_output_scf = os.path.join(cls._dirname_output, f'{cls.prefix}.save')
+        cls._filepath_output_hubbard_chi = os.path.join(cls._dirname_output_hubbard, cls._filename_output_hubbard_chi)
+        cls._filepath_output_perturbations = os.path.join(cls._dirname_output_hubbard, f'{cls.prefix}.*.pert_*.dat')
+
     @classmethod
     def define(cls, spec):
         """Define the process specification."""
@@ -203,12 +246,12 @@ class HpCalculation(CalcJob):
     @classproperty
     def filename_output_hubbard_chi(cls):  # pylint: disable=no-self-argument
         """Return the relative output filename that contains chi."""
-        return f'{cls.prefix}.chi.dat'
+        return cls._filename_output_hubbard_chi
 
     @classproperty
     def filename_output_hubbard(cls):  # pylint: disable=no-self-argument
         """Return the relative output filename that contains the Hubbard values and matrices."""
-        return f'{cls.prefix}.Hubbard_parameters.dat'
+        return cls._filename_output_hubbard
 
     @classproperty
     def filename_input_hubbard_parameters(cls):  # pylint: disable=no-self-argument,invalid-name, no-self-use
@@ -221,19 +264,19 @@ class HpCalculation(CalcJob):
         return 'HUBBARD.dat'
 
     @classproperty
-    def dirname_output(cls):  # pylint: disable=no-self-argument, no-self-use
+    def dirname_output(cls):  # pylint: disable=no-self-argument
         """Return the relative directory name that contains raw output data."""
-        return 'out'
+        return cls._dirname_output
 
     @classproperty
     def dirname_output_hubbard(cls):  # pylint: disable=no-self-argument
         """Return the relative directory name that contains raw output data written by hp.x."""
-        return os.path.join(cls.dirname_output, 'HP')
+        return cls._dirname_output_hubbard
 
     @classproperty
     def dirname_output_scf(cls):  # pylint: disable=no-self-argument
         """Return the relative directory name that contains raw output data written by pw.x."""
-        return os.path.join(cls.dirname_output, f'{cls.prefix}.save')
+        return cls._dirname_output_scf
 
     def prepare_for_submission(self, folder):
         """Create the input files from the input nodes passed to this instance of the `CalcJob`.
@@ -281,21 +324,16 @@ class HpCalculation(CalcJob):
 
         :returns: list of resource retrieval instructions
         """
-        retrieve_list = []
-
-        # Default output files that are written after a completed or post-processing HpCalculation
-        retrieve_list.append(self.options.output_filename)
-        retrieve_list.append(self.filename_output_hubbard)
-        retrieve_list.append(self.filename_output_hubbard_dat)
-        retrieve_list.append(os.path.join(self.dirname_output_hubbard, self.filename_output_hubbard_chi))
-
-        # The perturbation files that are necessary for a final `compute_hp` calculation in case this is an incomplete
-        # calculation that computes just a subset of all qpoints and/or all perturbed atoms.
-        src_perturbation_files = os.path.join(self.dirname_output_hubbard, f'{self.prefix}.*.pert_*.dat')
-        dst_perturbation_files = '.'
-        retrieve_list.append((src_perturbation_files, dst_perturbation_files, 3))
-
-        return retrieve_list
+        return [
+            # Default output files that are written after a completed or post-processing HpCalculation
+            self.options.output_filename,
+            self.filename_output_hubbard,
+            self.filename_output_hubbard_dat,
+            self._filepath_output_hubbard_chi,
+            # The perturbation files that are necessary for a final `compute_hp` calculation in case this is an
+            # incomplete calculation that computes just a subset of all qpoints and/or all perturbed atoms.
+            (self._filepath_output_perturbations, '.', 3),
+        ]
 
     def get_remote_copy_list(self, is_symlink) -> list[tuple]:
         """Return the `remote_{copy/symlink}_list`.
@@ -323,11 +361,13 @@ class HpCalculation(CalcJob):
         """
         local_copy_list, provenance_exclude_list = [], []
 
+        dirname = self.dirname_output_hubbard
+        prefix = dirname + os.sep
+
         for retrieved in self.inputs.get('parent_hp', {}).values():
-            local_copy_list.append((retrieved.uuid, self.dirname_output_hubbard, self.dirname_output_hubbard))
-            for filename in retrieved.base.repository.list_object_names(self.dirname_output_hubbard):
-                filepath = os.path.join(self.dirname_output_hubbard, filename)
-                provenance_exclude_list.append(filepath)
+            local_copy_list.append((retrieved.uuid, dirname, dirname))
+            filenames = retrieved.base.repository.list_object_names(dirname)
+            provenance_exclude_list.extend(prefix + filename for filename in filenames)
 
         return local_copy_list, provenance_exclude_list
 
@@ -339,8 +379,7 @@ class HpCalculation(CalcJob):
 
         :returns: a dictionary with input namelists and their flags
         """
-        result = _uppercase_dict(self.inputs.parameters.get_dict(), dict_name='parameters')
-        result = {key: _lowercase_dict(value, dict_name=key) for key, value in result.items()}
+        result = _normalize_namelists(self.inputs.parameters.get_dict())
 
         mesh, _ = self.inputs.qpoints.get_kpoints_mesh()
 
@@ -97,6 +97,11 @@ def launch_workflow(
 
             parameters['SYSTEM'].setdefault('starting_magnetization', {})[kind] = magnetization
 
+    # The pseudos, options and parameters are the same for all namespaces, so they are only determined once
+    pseudos = pseudo_family.get_pseudos(structure=structure)
+    options = get_default_options(max_num_machines, max_wallclock_seconds, with_mpi)
+    parameters_pw = orm.Dict(dict=parameters)
+
     inputs = {
         'structure': structure,
         'hubbard_u': orm.Dict(dict=dict(hubbard_u)),
@@ -105,10 +110,10 @@ def launch_workflow(
             'kpoints': kpoints_mesh,
             'pw': {
                 'code': code_pw,
-                'pseudos': pseudo_family.get_pseudos(structure=structure),
-                'parameters': orm.Dict(dict=parameters),
+                'pseudos': pseudos,
+                'parameters': parameters_pw,
                 'metadata': {
-                    'options': get_default_options(max_num_machines, max_wallclock_seconds, with_mpi)
+                    'options': options
                 }
             },
         },
@@ -118,10 +123,10 @@ def launch_workflow(
                 'kpoints': kpoints_mesh,
                 'pw': {
                     'code': code_pw,
-                    'pseudos': pseudo_family.get_pseudos(structure=structure),
-                    'parameters': orm.Dict(dict=parameters),
+                    'pseudos': pseudos,
+                    'parameters': parameters_pw,
                     'metadata': {
-                        'options': get_default_options(max_num_machines, max_wallclock_seconds, with_mpi)
+                        'options': options
                     }
                 }
             }
@@ -130,10 +135,10 @@ def launch_workflow(
             'kpoints': kpoints_mesh,
             'pw': {
                 'code': code_pw,
-                'pseudos': pseudo_family.get_pseudos(structure=structure),
-                'parameters': orm.Dict(dict=parameters),
+                'pseudos': pseudos,
+                'parameters': parameters_pw,
                 'metadata': {
-                    'options': get_default_options(max_num_machines, max_wallclock_seconds, with_mpi)
+                    'options': options
                 }
             }
         },
@@ -143,7 +148,7 @@ def launch_workflow(
                 'qpoints': qpoints_mesh,
                 'parameters': orm.Dict(dict=parameters_hp),
                 'metadata': {
-                    'options': get_default_options(max_num_machines, max_wallclock_seconds, with_mpi)
+                    'options': options
                 }
             },
             'parallelize_atoms': orm.Bool(parallelize_atoms),
@@ -1,9 +1,12 @@
 # -*- coding: utf-8 -*-
 """Parser implementation for the `HpCalculation` plugin."""
+from functools import cached_property
 import os
+import warnings
 
 from aiida import orm
 from aiida.common import exceptions
+from aiida.engine import ExitCode
 from aiida.parsers import Parser
 import numpy
 
@@ -25,6 +28,9 @@ class HpParser(Parser):
         # The stdout is always parsed by default.
         logs = self.parse_stdout()
 
+        if isinstance(logs, ExitCode):
+            return logs
+
         # Check for specific known problems that can cause a pre-mature termination of the calculation
         exit_code = self.validate_premature_exit(logs)
         if exit_code:
@@ -56,34 +62,43 @@ class HpParser(Parser):
             except (KeyError, FileNotFoundError):
                 self.get_hubbard_structure()
 
-    @property
+    @cached_property
+    def _retrieved_filenames(self):
+        """Return the set of filenames in the retrieved folder, which is only listed once per parser."""
+        return set(self.retrieved.base.repository.list_object_names())
+
+    @cached_property
+    def _inputhp(self):
+        """Return the ``INPUTHP`` namelist of the input parameters, which is looked up only once per parser."""
+        return self.node.inputs.parameters.base.attributes.get('INPUTHP', {})
+
+    @cached_property
     def is_initialization_only(self):
         """Return whether the calculation was an `initialization_only` run.
 
         This is the case if the `determin_num_pert_only` flag was set to `True` in the `INPUTHP` namelist.
         In this case, there will only be a stdout file. All other output files will be missing, but that is expected.
         """
-        return self.node.inputs.parameters.base.attributes.get('INPUTHP', {}).get('determine_num_pert_only', False)
+        return self._inputhp.get('determine_num_pert_only', False)
 
-    @property
+    @cached_property
     def is_partial_mesh(self):
         """Return whether the calculation was a run on a qpoint subset.
 
         This is the case if the `determine_q_mesh_only` flag was set to `True` in the `INPUTHP` namelist.
         In this case, there will only be a stdout file. All other output files will be missing, but that is expected.
         """
-        return self.node.inputs.parameters.base.attributes.get('INPUTHP', {}).get('determine_q_mesh_only', False)
+        return self._inputhp.get('determine_q_mesh_only', False)
 
-    @property
+    @cached_property
     def is_partial_site(self):
         """Return whether the calculation computed just a sub set of all sites to be perturbed.
 
         A complete run means that all perturbations were calculated and the final matrices were computed.
         """
-        card = self.node.inputs.parameters.base.attributes.get('INPUTHP', {})
-        return any(key.startswith('perturb_only_atom') for key in card.keys())
+        return any(key.startswith('perturb_only_atom') for key in self._inputhp)
 
-    @property
+    @cached_property
     def is_complete_calculation(self):
         """Return whether the calculation was a complete run.
 
@@ -96,26 +111,28 @@ class HpParser(Parser):
 
         Parse the output parameters from the output of a Hp calculation written to standard out.
 
-        :return: log messages
+        :return: log messages, or an exit code if the stdout is missing or could not be read or parsed
         """
         from .parse_raw.hp import parse_raw_output
 
         filename = self.node.base.attributes.get('output_filename')
 
-        if filename not in self.retrieved.base.repository.list_object_names():
+        if filename not in self._retrieved_filenames:
             return self.exit_codes.ERROR_OUTPUT_STDOUT_MISSING
 
         try:
-            stdout = self.retrieved.base.repository.get_object_content(filename)
+            with self.retrieved.base.repository.open(filename, 'r') as handle:
+                try:
+                    parsed_data, logs = parse_raw_output(handle)
+                except OSError:
+                    # The handle is read lazily while parsing, so read errors have to be caught before parse errors
+                    return self.exit_codes.ERROR_OUTPUT_STDOUT_READ
+                except Exception:  # pylint: disable=broad-except
+                    return self.exit_codes.ERROR_OUTPUT_STDOUT_PARSE
         except IOError:
             return self.exit_codes.ERROR_OUTPUT_STDOUT_READ
 
-        try:
-            parsed_data, logs = parse_raw_output(stdout)
-        except Exception:  # pylint: disable=broad-except
-            return self.exit_codes.ERROR_OUTPUT_STDOUT_PARSE
-        else:
-            self.out('parameters', orm.Dict(parsed_data))
+        self.out('parameters', orm.Dict(parsed_data))
 
         # If the stdout was incomplete, most likely the job was interrupted before it could cleanly finish, so the
         # output files are most likely corrupt and cannot be restarted from
@@ -147,22 +164,23 @@ class HpParser(Parser):
         """
         filename = HpCalculation.filename_output_hubbard
 
-        try:
-            with self.retrieved.base.repository.open(filename, 'r') as handle:
-                parsed_data = self.parse_hubbard_content(handle)
-        except IOError:
+        if filename not in self._retrieved_filenames:
             if self.is_complete_calculation:
                 return self.exit_codes.ERROR_OUTPUT_HUBBARD_MISSING
-        else:
-            matrices = orm.ArrayData()
-            matrices.set_array('chi', parsed_data['chi'])
-            matrices.set_array('chi0', parsed_data['chi0'])
-            matrices.set_array('chi_inv', parsed_data['chi_inv'])
-            matrices.set_array('chi0_inv', parsed_data['chi0_inv'])
-            matrices.set_array('hubbard', parsed_data['hubbard'])
+            return None
 
-            self.out('hubbard', orm.Dict(parsed_data['hubbard_U']))
-            self.out('hubbard_matrices', matrices)
+        with self.retrieved.base.repository.open(filename, 'rb') as handle:
+            parsed_data = self.parse_hubbard_content(handle)
+
+        matrices = orm.ArrayData()
+        matrices.set_array('chi', parsed_data['chi'])
+        matrices.set_array('chi0', parsed_data['chi0'])
+        matrices.set_array('chi_inv', parsed_data['chi_inv'])
+        matrices.set_array('chi0_inv', parsed_data['chi0_inv'])
+        matrices.set_array('hubbard', parsed_data['hubbard'])
+
+        self.out('hubbard', orm.Dict(parsed_data['hubbard_U']))
+        self.out('hubbard_matrices', matrices)
 
     def parse_hubbard_chi(self):
         """Parse the hubbard chi output file.
@@ -171,18 +189,19 @@ class HpParser(Parser):
         """
         filename = HpCalculation.filename_output_hubbard_chi
 
-        try:
-            with self.retrieved.base.repository.open(filename, 'r') as handle:
-                parsed_data = self.parse_chi_content(handle)
-        except IOError:
+        if filename not in self._retrieved_filenames:
             if self.is_complete_calculation:
                 return self.exit_codes.ERROR_OUTPUT_HUBBARD_CHI_MISSING
-        else:
-            output_chi = orm.ArrayData()
-            output_chi.set_array('chi', parsed_data['chi'])
-            output_chi.set_array('chi0', parsed_data['chi0'])
+            return None
+
+        with self.retrieved.base.repository.open(filename, 'rb') as handle:
+            parsed_data = self.parse_chi_content(handle)
 
-            self.out('hubbard_chi', output_chi)
+        output_chi = orm.ArrayData()
+        output_chi.set_array('chi', parsed_data['chi'])
+        output_chi.set_array('chi0', parsed_data['chi0'])
+
+        self.out('hubbard_chi', output_chi)
 
     def parse_hubbard_parameters(self):
         """Parse the hubbard parameters output file.
@@ -191,11 +210,11 @@ class HpParser(Parser):
         """
         filename = HpCalculation.filename_output_hubbard_parameters
 
-        try:
-            with self.retrieved.base.repository.open(filename, 'rb') as handle:
-                self.out('hubbard_parameters', orm.SinglefileData(file=handle))
-        except IOError:
-            pass  # the file is not required to exist
+        if filename not in self._retrieved_filenames:
+            return  # the file is not required to exist
+
+        with self.retrieved.base.repository.open(filename, 'rb') as handle:
+            self.out('hubbard_parameters', orm.SinglefileData(file=handle))
 
     def parse_hubbard_dat(self, folder_path):
         """Parse the Hubbard parameters output file.
@@ -216,19 +235,23 @@ class HpParser(Parser):
 
     def get_hubbard_structure(self):
         """Set in output an ``HubbardStructureData`` with standard Hubbard U formulation."""
-        from copy import deepcopy
+        from aiida_quantumespresso.common.hubbard import Hubbard
 
-        hubbard_structure = deepcopy(self.node.inputs.hubbard_structure)
-        hubbard_structure.clear_hubbard_parameters()
+        hubbard_structure = self.node.inputs.hubbard_structure.clone()
+        hubbard = hubbard_structure.hubbard
 
-        hubbard_sites = self.outputs.hubbard.get_dict()['sites']
+        parameters = []
 
-        for hubbard_site in hubbard_sites:
+        for hubbard_site in self.outputs.hubbard.get_dict()['sites']:
             index = int(hubbard_site['index'])
             manifold = hubbard_site['manifold']
             value = float(hubbard_site['value'])
-            args = (index, manifold, index, manifold, value, (0, 0, 0), 'Ueff')
-            hubbard_structure.append_hubbard_parameter(*args)
+            parameters.append((index, manifold, index, manifold, value, (0, 0, 0), 'Ueff'))
+
+        # Set all parameters at once, since every call to `append_hubbard_parameter` serializes the full `Hubbard`
+        hubbard_structure.hubbard = Hubbard.from_list(
+            parameters, projectors=hubbard.projectors, formulation=hubbard.formulation
+        )
 
         self.out('hubbard_structure', hubbard_structure)
 
@@ -238,34 +261,32 @@ class HpParser(Parser):
         :param filepath: absolute filepath to the chi.dat output file
         :returns: dictionary with parsed contents
         """
-        data = handle.readlines()
-
         result = {}
         blocks = {
-            'chi': [None, None],
-            'chi0': [None, None],
+            'chi': None,
+            'chi0': None,
         }
 
-        for line_number, line in enumerate(data):
-            if 'chi0 :' in line:
-                blocks['chi0'][0] = line_number + 1
+        # The markers always appear in this order, so only the next expected one has to be looked for on each line
+        markers = iter(((b'chi0 :', 'chi0'), (b'chi :', 'chi')))
+        marker, matrix_name = next(markers)
+        block = None
 
-            if 'chi :' in line:
-                blocks['chi0'][1] = line_number
-                blocks['chi'][0] = line_number + 1
-                blocks['chi'][1] = len(data)
-                break
+        # The lines are streamed into the block of the last marker found, so the file is never held in memory at once
+        for line in handle:
+            if marker is not None and marker in line:
+                block = blocks[matrix_name] = []
+                marker, matrix_name = next(markers, (None, None))
+            elif block is not None:
+                block.append(line)
 
-        if not all(sum(list(blocks.values()), [])):
+        if any(block is None for block in blocks.values()):
             raise ValueError(
                 f"could not determine beginning and end of all blocks in '{os.path.basename(handle.name)}'"
             )
 
         for matrix_name in ('chi0', 'chi'):
-            matrix_block = blocks[matrix_name]
-            matrix_data = data[matrix_block[0]:matrix_block[1]]
-            matrix = numpy.array(self.parse_hubbard_matrix(matrix_data))
-            result[matrix_name] = matrix
+            result[matrix_name] = self.parse_hubbard_matrix(blocks[matrix_name])
 
         return result
 
@@ -275,70 +296,58 @@ class HpParser(Parser):
         :param filepath: absolute filepath to the Hubbard_parameters.dat output file
         :returns: dictionary with parsed contents
         """
-        data = handle.readlines()
-
         result = {'hubbard_U': {'sites': []}}
         blocks = {
-            'chi': [None, None],
-            'chi0': [None, None],
-            'chi_inv': [None, None],
-            'chi0_inv': [None, None],
-            'hubbard': [None, None],
+            'chi': None,
+            'chi0': None,
+            'chi_inv': None,
+            'chi0_inv': None,
+            'hubbard': None,
         }
 
-        for line_number, line in enumerate(data):
-
-            if 'site n.' in line:
-                parsed = False
-                subline_number = line_number + 1
-                while not parsed:
-                    subline = data[subline_number].strip()
-                    if subline:
-                        subline_number += 1
-                        subdata = subline.split()
-                        result['hubbard_U']['sites'].append({
-                            'index': int(subdata[0]) - 1,  # QE indices start from 1
-                            'type': int(subdata[1]),
-                            'kind': subdata[2],
-                            'spin': int(subdata[3]),
-                            'new_type': int(subdata[4]),
-                            'new_kind': subdata[5],
-                            'manifold': subdata[6],
-                            'value': float(subdata[7]),
-                        })
-                    else:
-                        parsed = True
-
-            if 'chi0 matrix' in line:
-                blocks['chi0'][0] = line_number + 1
-
-            if 'chi matrix' in line:
-                blocks['chi0'][1] = line_number
-                blocks['chi'][0] = line_number + 1
-
-            if 'chi0^{-1} matrix' in line:
-                blocks['chi'][1] = line_number
-                blocks['chi0_inv'][0] = line_number + 1
-
-            if 'chi^{-1} matrix' in line:
-                blocks['chi0_inv'][1] = line_number
-                blocks['chi_inv'][0] = line_number + 1
-
-            if 'Hubbard matrix' in line:
-                blocks['chi_inv'][1] = line_number
-                blocks['hubbard'][0] = line_number + 1
-                blocks['hubbard'][1] = len(data)
-                break
-
-        if not all(sum(list(blocks.values()), [])):
+        # The markers always appear in this order, so only the next expected one has to be looked for on each line
+        markers = iter((
+            (b'chi0 matrix', 'chi0'),
+            (b'chi matrix', 'chi'),
+            (b'chi0^{-1} matrix', 'chi0_inv'),
+            (b'chi^{-1} matrix', 'chi_inv'),
+            (b'Hubbard matrix', 'hubbard'),
+        ))
+        marker, matrix_name = next(markers)
+        block = None
+
+        # The lines are streamed into the block of the last marker found, so the file is never held in memory at once
+        for line in handle:
+
+            if b'site n.' in line:
+                # Consume the site lines from the same iterator, so they are not scanned again for the markers
+                for subline in handle:
+                    subdata = subline.decode().split()
+                    if not subdata:
+                        break
+                    result['hubbard_U']['sites'].append({
+                        'index': int(subdata[0]) - 1,  # QE indices start from 1
+                        'type': int(subdata[1]),
+                        'kind': subdata[2],
+                        'spin': int(subdata[3]),
+                        'new_type': int(subdata[4]),
+                        'new_kind': subdata[5],
+                        'manifold': subdata[6],
+                        'value': float(subdata[7]),
+                    })
+            elif marker is not None and marker in line:
+                block = blocks[matrix_name] = []
+                marker, matrix_name = next(markers, (None, None))
+            elif block is not None:
+                block.append(line)
+
+        if any(block is None for block in blocks.values()):
             raise ValueError(
                 f'could not determine beginning and end of all matrix blocks in `{os.path.basename(handle.name)}`'
             )
 
         for matrix_name in ('chi0', 'chi', 'chi0_inv', 'chi_inv', 'hubbard'):
-            matrix_block = blocks[matrix_name]
-            matrix_data = data[matrix_block[0]:matrix_block[1]]
-            matrix = self.parse_hubbard_matrix(matrix_data)
+            matrix = self.parse_hubbard_matrix(blocks[matrix_name])
 
             if len(set(matrix.shape)) != 1:
                 filename = os.path.basename(handle.name)
@@ -359,22 +368,48 @@ class HpParser(Parser):
         followed by an empty line. In the parsing of the data, we will use the empty line to detect the end of the
         current matrix row.
 
-        :param data: a list of strings representing lines in the Hubbard_parameters.dat file of a certain matrix
+        The values of all rows are converted in a single call to ``numpy.fromstring``, after which the flat array is
+        reshaped using the number of rows and the number of values per row.
+
+        :param data: a list of lines, as strings or bytes, in the Hubbard_parameters.dat file of a certain matrix
         :returns: square numpy matrix of floats representing the parsed matrix
+        :raises ValueError: if the values cannot be parsed or the rows do not all have the same length
         """
-        matrix = []
-        row = []
+        row_lengths = []
+        is_row = False
 
         for line in data:
             if line.strip():
-                for value in line.split():
-                    row.append(float(value))
+                if not is_row:
+                    row_lengths.append(0)
+                    is_row = True
+                row_lengths[-1] += len(line.split())
             else:
-                if row:
-                    matrix.append(row)
-                row = []
+                is_row = False
+
+        if not row_lengths:
+            return numpy.array([])
+
+        number_of_rows = len(row_lengths)
+        number_of_columns = row_lengths[0]
+
+        if row_lengths.count(number_of_columns) != number_of_rows:
+            raise ValueError(f'the rows of the matrix do not all have the same length: {row_lengths}')
+
+        separator = b' ' if isinstance(data[0], bytes) else ' '
+
+        message = 'the matrix contains values that cannot be converted to floats'
+
+        # Depending on the version, ``numpy.fromstring`` either raises or stops at the first value it cannot convert,
+        # e.g. the ``*****`` that Fortran writes when a value overflows its format, emitting a ``DeprecationWarning``.
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', DeprecationWarning)
+                values = numpy.fromstring(separator.join(data), sep=' ')
+        except ValueError as exception:
+            raise ValueError(message) from exception
 
-        if row:
-            matrix.append(row)
+        if values.size != number_of_rows * number_of_columns:
+            raise ValueError(message)
 
-        return numpy.array(matrix)
+        return values.reshape(number_of_rows, number_of_columns)
@@ -8,36 +8,80 @@ import re
 
 from aiida_quantumespresso.utils.mapping import get_logging_container
 
+REGEX_NUMBER_OF_QPOINTS = re.compile(r'The grid of q-points.*?(\d+)\s+q-points')
+REGEX_PERTURBED_ATOMS = re.compile(r'List of.*?(\d+)\s+atoms which will be perturbed')
+REG_ERROR_CONVERGENCE_NOT_REACHED = re.compile(r'Convergence has not been reached after\s+([0-9]+)\s+iterations!')
+ERROR_POSITIONS = 'WARNING! All Hubbard atoms must be listed first in the ATOMIC_POSITIONS card of PWscf'
+
+MESSAGE_MAP = {
+    'error': {
+        'Error in routine hub_read_chi (1)': 'ERROR_MISSING_PERTURBATION_FILE',
+        'Maximum CPU time exceeded': 'ERROR_OUT_OF_WALLTIME',
+        'reading inputhp namelist': 'ERROR_INVALID_NAMELIST',
+        'problems computing cholesky': 'ERROR_COMPUTING_CHOLESKY',
+        'Reconstruction problem: some chi were not found': 'ERROR_MISSING_CHI_MATRICES',
+        'incompatible FFT grid': 'ERROR_INCOMPATIBLE_FFT_GRID',
+        REG_ERROR_CONVERGENCE_NOT_REACHED: 'ERROR_CONVERGENCE_NOT_REACHED',
+        ERROR_POSITIONS: 'ERROR_INCORRECT_ORDER_ATOMIC_POSITIONS',
+        'WARNING: The Fermi energy shift is zero or too big!': 'ERROR_FERMI_SHIFT',
+    },
+    'warning': {
+        'Warning:': None,
+        'DEPRECATED:': None,
+    }
+}
+
+# Each marker is a named group of a single alternation, so one search per line finds all markers present in the line.
+# The name of the group that matched is used to look up the log level and the message to add.
+MESSAGE_MARKERS = [
+    (level, marker, message) for level, markers in MESSAGE_MAP.items() for marker, message in markers.items()
+]
+MESSAGE_DISPATCH = {f'marker_{index}': (level, message) for index, (level, _, message) in enumerate(MESSAGE_MARKERS)}
+REGEX_MESSAGE_MARKERS = re.compile(
+    '|'.join(
+        f'(?P<marker_{index}>{marker.pattern if hasattr(marker, "search") else re.escape(marker)})'
+        for index, (_, marker, _) in enumerate(MESSAGE_MARKERS)
+    )
+)
+
 
 def parse_raw_output(stdout):
     """Parse the output parameters from the output of a Hp calculation written to standard out.
 
-    :param filepath: path to file containing output written to stdout
+    The lines are consumed one by one, so an open file handle can be passed directly to avoid loading the entire
+    content in memory.
+
+    :param stdout: the content written to stdout, either as a string or as an iterable of lines, e.g. a file handle
     :returns: boolean representing success status of parsing, True equals parsing was successful
     :returns: dictionary with the parsed parameters
     """
     parsed_data = {}
     logs = get_logging_container()
+    seen = {level: set() for level in logs}
     is_prematurely_terminated = True
 
-    # Parse the output line by line by creating an iterator of the lines
-    iterator = iter(stdout.split('\n'))
+    if isinstance(stdout, str):
+        stdout = stdout.splitlines()
+
+    # Parse the output line by line by creating an iterator of the lines, stripping the trailing newlines of a handle
+    iterator = (line.rstrip('\n') for line in stdout)
     for line in iterator:
 
         # If the output does not contain the line with 'JOB DONE' the program was prematurely terminated
-        if 'JOB DONE' in line:
+        if is_prematurely_terminated and 'JOB DONE' in line:
             is_prematurely_terminated = False
 
-        detect_important_message(logs, line)
+        detect_important_message(logs, line, seen)
 
-        # A calculation that will only perturb a single atom will only print one line
-        match = re.search(r'.*The grid of q-points.*?(\d+)+\s+q-points.*', line)
-        if match:
-            parsed_data['number_of_qpoints'] = int(match.group(1))
+        # The patterns are only matched on lines that contain their literal part, which is much cheaper to check
+        if 'q-points' in line:
+            match = REGEX_NUMBER_OF_QPOINTS.search(line)
+            if match:
+                parsed_data['number_of_qpoints'] = int(match.group(1))
 
         # Determine the atomic sites that will be perturbed, or that the calculation expects
         # to have been calculated when post-processing the final matrices
-        match = re.search(r'.*List of.*?(\d+)\s+atoms which will be perturbed.*', line)
+        match = REGEX_PERTURBED_ATOMS.search(line) if 'atoms which will be perturbed' in line else None
         if match:
             hubbard_sites = {}
             number_of_perturbed_atoms = int(match.group(1))
@@ -50,8 +94,7 @@ def parse_raw_output(stdout):
             parsed_data['hubbard_sites'] = hubbard_sites
 
         # A calculation that will only perturb a single atom will only print one line
-        match = re.search(r'.*Atom which will be perturbed.*', line)
-        if match:
+        if 'Atom which will be perturbed' in line:
             hubbard_sites = {}
             number_of_perturbed_atoms = 1
             _ = next(iterator)  # skip blank line
@@ -65,53 +108,26 @@ def parse_raw_output(stdout):
     if is_prematurely_terminated:
         logs.error.append('ERROR_OUTPUT_STDOUT_INCOMPLETE')
 
-    # Remove duplicate log messages by turning it into a set. Then convert back to list as that is what is expected
-    logs.error = list(set(logs.error))
-    logs.warning = list(set(logs.warning))
-
     return parsed_data, logs
 
 
-def detect_important_message(logs, line):
-    """Detect error or warning messages, and append to the log if a match is found."""
-    REG_ERROR_CONVERGENCE_NOT_REACHED = re.compile(
-        r'.*Convergence has not been reached after\s+([0-9]+)\s+iterations!.*'
-    )
-    ERROR_POSITIONS = 'WARNING! All Hubbard atoms must be listed first in the ATOMIC_POSITIONS card of PWscf'
-    message_map = {
-        'error': {
-            'Error in routine hub_read_chi (1)': 'ERROR_MISSING_PERTURBATION_FILE',
-            'Maximum CPU time exceeded': 'ERROR_OUT_OF_WALLTIME',
-            'reading inputhp namelist': 'ERROR_INVALID_NAMELIST',
-            'problems computing cholesky': 'ERROR_COMPUTING_CHOLESKY',
-            'Reconstruction problem: some chi were not found': 'ERROR_MISSING_CHI_MATRICES',
-            'incompatible FFT grid': 'ERROR_INCOMPATIBLE_FFT_GRID',
-            REG_ERROR_CONVERGENCE_NOT_REACHED: 'ERROR_CONVERGENCE_NOT_REACHED',
-            ERROR_POSITIONS: 'ERROR_INCORRECT_ORDER_ATOMIC_POSITIONS',
-            'WARNING: The Fermi energy shift is zero or too big!': 'ERROR_FERMI_SHIFT',
-        },
-        'warning': {
-            'Warning:': None,
-            'DEPRECATED:': None,
-        }
-    }
+def detect_important_message(logs, line, seen=None):
+    """Detect error or warning messages, and append to the log if a match is found.
+
+    Messages that are already in the log are not added again, so the log contains each message once in the order in
+    which they were first encountered.
 
-    # Match any known error and warning messages
-    for marker, message in message_map['error'].items():
-        # Replace with isinstance(marker, re.Pattern) once Python 3.6 is dropped
-        if hasattr(marker, 'search'):
-            if marker.match(line):
-                if message is None:
-                    message = line
-                logs.error.append(message)
-        else:
-            if marker in line:
-                if message is None:
-                    message = line
-                logs.error.append(message)
-
-    for marker, message in message_map['warning'].items():
-        if marker in line:
-            if message is None:
-                message = line
-            logs.warning.append(message)
+    :param logs: the logging container to which the messages are appended
+    :param line: the line of the stdout to check
+    :param seen: optional mapping of each log level onto the set of its messages, which is updated in place. Passing
+        it when calling this function for many lines makes the check for duplicate messages constant time.
+    """
+    if seen is None:
+        seen = {level: set(messages) for level, messages in logs.items()}
+
+    for match in REGEX_MESSAGE_MARKERS.finditer(line):
+        level, message = MESSAGE_DISPATCH[match.lastgroup]
+        message = line if message is None else message
+        if message not in seen[level]:
+            seen[level].add(message)
+            logs[level].append(message)
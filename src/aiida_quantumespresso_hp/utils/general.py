@@ -2,8 +2,13 @@
 """General utilies."""
 from __future__ import annotations
 
+import re
 from typing import List
 
+from aiida import orm
+
+REGEX_PERTURB_ONLY_ATOM = re.compile(r'perturb_only_atom.*?(\d+)')
+
 
 def set_tot_magnetization(input_parameters: dict, tot_magnetization: float) -> bool:
     """Set the total magnetization based on its value and the input parameters.
@@ -25,20 +30,15 @@ def is_perturb_only_atom(parameters: dict) -> int | None:
 
     :return: atomic index (QuantumESPRESSO format), None if the key is not in parameters
     """
-    import re
+    for key, value in parameters.items():
+        if not value or not key.startswith('perturb_only_atom'):  # also the key must be `True`
+            continue
 
-    match = None  # making sure that if the dictionary is empty we don't raise an `UnboundLocalError`
-
-    for key in parameters.keys():
-        match = re.search(r'perturb_only_atom.*?(\d+).*', key)
+        match = REGEX_PERTURB_ONLY_ATOM.search(key)
         if match:
-            if not parameters[key]:  # also the key must be `True`
-                match = None  # making sure to have `None`
-            else:
-                match = int(match.group(1))
-                break
+            return int(match.group(1))
 
-    return match
+    return None
 
 
 def distribute_base_workchains(n_atoms: int, n_total: int) -> List[int]:
@@ -54,13 +54,63 @@ def distribute_base_workchains(n_atoms: int, n_total: int) -> List[int]:
     :param n_total: The number of base workchains to be launched.
     :return: The number of base workchains to be launched for each atom.
     """
-    quotient = n_total // n_atoms
-    remainder = n_total % n_atoms
-    n_distributed = [quotient] * n_atoms
+    quotient, remainder = divmod(n_total, n_atoms)
+
+    # Atoms that would get no work chain are dropped, which can only happen when `n_total < n_atoms`
+    n_active = min(n_atoms, n_total)
 
-    for i in range(remainder):
-        n_distributed[i] += 1
+    return [quotient + 1] * remainder + [quotient] * (n_active - remainder)
 
-    n_distributed = [x for x in n_distributed if x != 0]
 
-    return n_distributed
+def clean_remote_folders(node: orm.ProcessNode) -> List[int]:
+    """Clean the remote folders of all the calculation jobs called, directly or indirectly, by the given process.
+
+    The called processes are queried one level of the call stack at a time, after which the remote folders of all the
+    calculation jobs are fetched with a single query, instead of loading every called descendant as a node. The remote
+    folders are grouped by computer, such that a single transport is opened for each computer, instead of connecting
+    again for every remote folder that has to be cleaned.
+
+    :param node: the process node whose called calculation jobs to clean.
+    :return: the pks of the calculation jobs whose remote folder was cleaned.
+    """
+    callers = [node.pk]
+    calcjobs = []
+
+    while callers:
+        query = orm.QueryBuilder().append(orm.ProcessNode, filters={'id': {'in': callers}}, tag='caller')
+        query.append(orm.ProcessNode, with_incoming='caller', project=['id', 'node_type'])
+        callers = []
+
+        for pk, node_type in query.iterall():
+            if node_type.startswith('process.workflow.'):
+                callers.append(pk)
+            elif node_type.startswith('process.calculation.calcjob.'):
+                calcjobs.append(pk)
+
+    if not calcjobs:
+        return []
+
+    query = orm.QueryBuilder().append(orm.CalcJobNode, filters={'id': {'in': calcjobs}}, tag='calc', project='id')
+    query.append(orm.RemoteData, with_incoming='calc', edge_filters={'label': 'remote_folder'}, project='*')
+    query.order_by({'calc': 'id'})
+
+    remote_folders = {}
+
+    for pk, remote_folder in query.iterall():
+        remote_folders.setdefault(remote_folder.computer.pk, []).append((pk, remote_folder))
+
+    cleaned_calcs = []
+
+    for folders in remote_folders.values():
+        try:
+            with folders[0][1].get_authinfo().get_transport() as transport:
+                for pk, remote_folder in folders:
+                    try:
+                        remote_folder._clean(transport=transport)  # pylint: disable=protected-access
+                        cleaned_calcs.append(pk)
+                    except (IOError, OSError, KeyError):
+                        pass
+        except (IOError, OSError):
+            pass
+
+    return cleaned_calcs
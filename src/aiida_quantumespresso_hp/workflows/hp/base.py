@@ -7,6 +7,8 @@ from aiida.engine import BaseRestartWorkChain, ProcessHandlerReport, process_han
 from aiida.plugins import CalculationFactory
 from aiida_quantumespresso.workflows.protocols.utils import ProtocolMixin
 
+from aiida_quantumespresso_hp.utils.general import clean_remote_folders
+
 HpCalculation = CalculationFactory('quantumespresso.hp')
 
 
@@ -247,15 +249,7 @@ class HpBaseWorkChain(BaseRestartWorkChain, ProtocolMixin):
             self.report('remote folders will not be cleaned')
             return
 
-        cleaned_calcs = []
-
-        for called_descendant in self.node.called_descendants:
-            if isinstance(called_descendant, orm.CalcJobNode):
-                try:
-                    called_descendant.outputs.remote_folder._clean()  # pylint: disable=protected-access
-                    cleaned_calcs.append(called_descendant.pk)
-                except (IOError, OSError, KeyError):
-                    pass
+        cleaned_calcs = clean_remote_folders(self.node)
 
         if cleaned_calcs:
             self.report(f"cleaned remote folders of calculations: {' '.join(map(str, cleaned_calcs))}")
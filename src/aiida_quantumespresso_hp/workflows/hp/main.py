@@ -6,6 +6,8 @@ from aiida.engine import ToContext, WorkChain, if_
 from aiida.plugins import WorkflowFactory
 from aiida_quantumespresso.workflows.protocols.utils import ProtocolMixin
 
+from aiida_quantumespresso_hp.utils.general import clean_remote_folders
+
 HpBaseWorkChain = WorkflowFactory('quantumespresso.hp.base')
 HpParallelizeAtomsWorkChain = WorkflowFactory('quantumespresso.hp.parallelize_atoms')
 
@@ -127,17 +129,20 @@ class HpWorkChain(WorkChain, ProtocolMixin):
             create_kpoints_from_distance,
         )
 
-        if all(key not in self.inputs for key in ['qpoints', 'qpoints_distance']):
+        process_inputs = self.inputs
+
+        if all(key not in process_inputs for key in ['qpoints', 'qpoints_distance']):
             return self.exit_codes.ERROR_INVALID_INPUT_QPOINTS
 
         try:
-            qpoints = self.inputs.qpoints
+            qpoints = process_inputs.qpoints
         except AttributeError:
-            if 'hubbard_structure' in self.inputs.hp:
+            hp_inputs = process_inputs.hp
+            if 'hubbard_structure' in hp_inputs:
                 inputs = {
-                    'structure': self.inputs.hp.hubbard_structure,
-                    'distance': self.inputs.qpoints_distance,
-                    'force_parity': self.inputs.get('qpoints_force_parity', orm.Bool(False)),
+                    'structure': hp_inputs.hubbard_structure,
+                    'distance': process_inputs.qpoints_distance,
+                    'force_parity': process_inputs.get('qpoints_force_parity', orm.Bool(False)),
                     'metadata': {
                         'call_link_label': 'create_qpoints_from_distance'
                     }
@@ -162,12 +167,13 @@ class HpWorkChain(WorkChain, ProtocolMixin):
 
     def run_parallel_workchain(self):
         """Run the `HpParallelizeAtomsWorkChain`."""
+        process_inputs = self.inputs
         inputs = AttributeDict(self.exposed_inputs(HpBaseWorkChain))
-        inputs.clean_workdir = self.inputs.clean_workdir
-        inputs.parallelize_qpoints = self.inputs.parallelize_qpoints
+        inputs.clean_workdir = process_inputs.clean_workdir
+        inputs.parallelize_qpoints = process_inputs.parallelize_qpoints
         inputs.hp.qpoints = self.ctx.qpoints
-        if 'max_concurrent_base_workchains' in self.inputs:
-            inputs.max_concurrent_base_workchains = self.inputs.max_concurrent_base_workchains
+        if 'max_concurrent_base_workchains' in process_inputs:
+            inputs.max_concurrent_base_workchains = process_inputs.max_concurrent_base_workchains
         running = self.submit(HpParallelizeAtomsWorkChain, **inputs)
         self.report(f'running in parallel, launching HpParallelizeAtomsWorkChain<{running.pk}>')
         return ToContext(workchain=running)
@@ -190,15 +196,7 @@ class HpWorkChain(WorkChain, ProtocolMixin):
             self.report('remote folders will not be cleaned')
             return
 
-        cleaned_calcs = []
-
-        for called_descendant in self.node.called_descendants:
-            if isinstance(called_descendant, orm.CalcJobNode):
-                try:
-                    called_descendant.outputs.remote_folder._clean()  # pylint: disable=protected-access
-                    cleaned_calcs.append(called_descendant.pk)
-                except (IOError, OSError, KeyError):
-                    pass
+        cleaned_calcs = clean_remote_folders(self.node)
 
         if cleaned_calcs:
             self.report(f"cleaned remote folders of calculations: {' '.join(map(str, cleaned_calcs))}")
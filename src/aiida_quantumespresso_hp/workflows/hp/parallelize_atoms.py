@@ -5,7 +5,7 @@ from aiida.common import AttributeDict
 from aiida.engine import WorkChain, while_
 from aiida.plugins import CalculationFactory, WorkflowFactory
 
-from aiida_quantumespresso_hp.utils.general import distribute_base_workchains
+from aiida_quantumespresso_hp.utils.general import clean_remote_folders, distribute_base_workchains
 
 PwCalculation = CalculationFactory('quantumespresso.pw')
 HpCalculation = CalculationFactory('quantumespresso.hp')
@@ -48,6 +48,8 @@ class HpParallelizeAtomsWorkChain(WorkChain):
             message='The child work chain failed.')
         spec.exit_code(302, 'ERROR_FINAL_WORKCHAIN_FAILED',
             message='The child work chain failed.')
+        spec.exit_code(303, 'ERROR_CHILD_RETRIEVED_MISSING',
+            message='A child work chain did not return the `retrieved` output.')
 
 
     def run_init(self):
@@ -77,6 +79,7 @@ class HpParallelizeAtomsWorkChain(WorkChain):
 
         output_params = workchain.outputs.parameters.get_dict()
         self.ctx.hubbard_sites = list(output_params['hubbard_sites'].items())
+        self.ctx.atom_keys = []
 
     def should_run_atoms(self):
         """Return whether there are more atoms to run."""
@@ -93,37 +96,74 @@ class HpParallelizeAtomsWorkChain(WorkChain):
                 len(self.ctx.hubbard_sites), self.inputs.max_concurrent_base_workchains.value
                 )
 
-        for max_concurrent_base_workchains_site in max_concurrent_base_workchains_sites:
-            site_index, site_kind = self.ctx.hubbard_sites.pop(0)
+        # The exposed inputs and parameters are the same for all sites, so they are only built once. Each site gets
+        # shallow copies of the namespaces that are modified, such that the base inputs are left untouched.
+        base_inputs = AttributeDict(self.exposed_inputs(HpBaseWorkChain))
+        base_inputs.clean_workdir = self.inputs.clean_workdir
+        base_parameters = base_inputs.hp.parameters.get_dict()
+
+        running = {}
+        launched = []
+        # At most two distinct limits are distributed over the sites, so each `Int` node is shared by all its sites
+        max_concurrent_nodes = {}
+
+        # Take all the sites to launch in this step at once, instead of shifting the remaining list for every site
+        number_of_sites = len(max_concurrent_base_workchains_sites)
+        hubbard_sites = self.ctx.hubbard_sites[:number_of_sites]
+        self.ctx.hubbard_sites = self.ctx.hubbard_sites[number_of_sites:]
+
+        for (site_index, site_kind), max_concurrent_base_workchains_site in zip(
+            hubbard_sites, max_concurrent_base_workchains_sites
+        ):
             do_only_key = f'perturb_only_atom({site_index})'
             key = f'atom_{site_index}'
 
-            inputs = AttributeDict(self.exposed_inputs(HpBaseWorkChain))
-            inputs.clean_workdir = self.inputs.clean_workdir
-            inputs.hp.parameters = inputs.hp.parameters.get_dict()
-            inputs.hp.parameters['INPUTHP'][do_only_key] = True
-            inputs.hp.parameters = orm.Dict(inputs.hp.parameters)
+            parameters = {**base_parameters, 'INPUTHP': {**base_parameters['INPUTHP'], do_only_key: True}}
+
+            inputs = AttributeDict(base_inputs)
+            inputs.hp = AttributeDict(base_inputs.hp)
+            inputs.hp.parameters = orm.Dict(parameters)
+            inputs.metadata = AttributeDict(base_inputs.metadata)
             inputs.metadata.call_link_label = key
             if parallelize_qpoints and max_concurrent_base_workchains_site != -1:
-                inputs.max_concurrent_base_workchains = orm.Int(max_concurrent_base_workchains_site)
+                value = max_concurrent_base_workchains_site
+                if value not in max_concurrent_nodes:
+                    max_concurrent_nodes[value] = orm.Int(value)
+                inputs.max_concurrent_base_workchains = max_concurrent_nodes[value]
             node = self.submit(workflow, **inputs)
-            self.to_context(**{key: node})
-            name = workflow.__name__
-            self.report(f'launched {name}<{node.pk}> for atomic site {site_index} of kind {site_kind}')
+            running[key] = node
+            launched.append(f'{workflow.__name__}<{node.pk}> for atomic site {site_index} of kind {site_kind}')
+
+        # A single report for all children, since every report is written to the database as a separate log entry
+        self.report(f"launched {', '.join(launched)}")
+        self.to_context(**running)
+        self.ctx.atom_keys.extend(running)
 
     def inspect_atoms(self):
         """Inspect each parallel atom `HpBaseWorkChain`."""
-        for key, workchain in self.ctx.items():
-            if key.startswith('atom_'):
-                if not workchain.is_finished_ok:
-                    self.report(f'child work chain {workchain} failed with status {workchain.exit_status}, aborting.')
-                    return self.exit_codes.ERROR_ATOM_WORKCHAIN_FAILED
+        for key in self.ctx.atom_keys:
+            workchain = self.ctx[key]
+            if not workchain.is_finished_ok:
+                self.report(f'child work chain {workchain} failed with status {workchain.exit_status}, aborting.')
+                return self.exit_codes.ERROR_ATOM_WORKCHAIN_FAILED
 
     def run_final(self):
         """Perform the final `HpCalculation` to collect the various components of the chi matrices."""
         inputs = AttributeDict(self.exposed_inputs(HpBaseWorkChain))
         inputs.hp.parent_scf = inputs.hp.parent_scf
-        inputs.hp.parent_hp = {key: wc.outputs.retrieved for key, wc in self.ctx.items() if key.startswith('atom_')}
+
+        # Fetch the ``retrieved`` outputs of all children with a single query, instead of resolving them one by one
+        keys = {self.ctx[key].pk: key for key in self.ctx.atom_keys}
+        filters = {'id': {'in': list(keys)}}
+        query = orm.QueryBuilder().append(orm.WorkflowNode, filters=filters, tag='child', project='id')
+        query.append(orm.FolderData, with_incoming='child', edge_filters={'label': 'retrieved'}, project='*')
+        inputs.hp.parent_hp = {keys[pk]: retrieved for pk, retrieved in query.iterall()}
+
+        missing = [key for key in keys.values() if key not in inputs.hp.parent_hp]
+        if missing:
+            self.report(f'the child work chains {missing} did not return the `retrieved` output, aborting.')
+            return self.exit_codes.ERROR_CHILD_RETRIEVED_MISSING
+
         inputs.hp.metadata.options.max_wallclock_seconds =  3600 # 1 hour is more than enough
         inputs.metadata.call_link_label = 'compute_hp'
 
@@ -151,15 +191,7 @@ class HpParallelizeAtomsWorkChain(WorkChain):
             self.report('remote folders will not be cleaned')
             return
 
-        cleaned_calcs = []
-
-        for called_descendant in self.node.called_descendants:
-            if isinstance(called_descendant, orm.CalcJobNode):
-                try:
-                    called_descendant.outputs.remote_folder._clean()  # pylint: disable=protected-access
-                    cleaned_calcs.append(called_descendant.pk)
-                except (IOError, OSError, KeyError):
-                    pass
+        cleaned_calcs = clean_remote_folders(self.node)
 
         if cleaned_calcs:
             self.report(f"cleaned remote folders of calculations: {' '.join(map(str, cleaned_calcs))}")
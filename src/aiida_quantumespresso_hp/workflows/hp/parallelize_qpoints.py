@@ -5,7 +5,7 @@ from aiida.common import AttributeDict
 from aiida.engine import WorkChain, while_
 from aiida.plugins import CalculationFactory, WorkflowFactory
 
-from aiida_quantumespresso_hp.utils.general import is_perturb_only_atom
+from aiida_quantumespresso_hp.utils.general import clean_remote_folders, is_perturb_only_atom
 
 PwCalculation = CalculationFactory('quantumespresso.pw')
 HpCalculation = CalculationFactory('quantumespresso.hp')
@@ -54,6 +54,8 @@ class HpParallelizeQpointsWorkChain(WorkChain):
             message='The child work chain failed.')
         spec.exit_code(302, 'ERROR_FINAL_WORKCHAIN_FAILED',
             message='The child work chain failed.')
+        spec.exit_code(303, 'ERROR_CHILD_RETRIEVED_MISSING',
+            message='A child work chain did not return the `retrieved` output.')
 
     def run_init(self):
         """Run an initialization `HpBaseWorkChain` that will determine the number of perturbations (q points).
@@ -83,6 +85,7 @@ class HpParallelizeQpointsWorkChain(WorkChain):
             return self.exit_codes.ERROR_INITIALIZATION_WORKCHAIN_FAILED
 
         self.ctx.qpoints = list(range(workchain.outputs.parameters.dict.number_of_qpoints))
+        self.ctx.qpoint_keys = []
 
     def should_run_qpoints(self):
         """Return whether there are more q points to run."""
@@ -92,35 +95,66 @@ class HpParallelizeQpointsWorkChain(WorkChain):
         """Run a separate `HpBaseWorkChain` for each of the q points."""
         n_base_parallel = self.inputs.max_concurrent_base_workchains.value if 'max_concurrent_base_workchains' in self.inputs else len(self.ctx.qpoints)
 
-        for _ in self.ctx.qpoints[:n_base_parallel]:
-            qpoint_index = self.ctx.qpoints.pop(0)
+        # The exposed inputs and parameters are the same for all q points, so they are only built once. Each q point
+        # gets shallow copies of the namespaces that are modified, such that the base inputs are left untouched.
+        base_inputs = AttributeDict(self.exposed_inputs(HpBaseWorkChain))
+        base_inputs.clean_workdir = self.inputs.clean_workdir
+        base_parameters = base_inputs.hp.parameters.get_dict()
+        base_inputhp = base_parameters['INPUTHP']
+
+        running = {}
+        launched = []
+
+        # Take all the q points to launch in this step at once, instead of shifting the remaining list for every one
+        qpoints = self.ctx.qpoints[:n_base_parallel]
+        self.ctx.qpoints = self.ctx.qpoints[n_base_parallel:]
+
+        for qpoint_index in qpoints:
             key = f'qpoint_{qpoint_index + 1}' # to keep consistency with QE
-            inputs = AttributeDict(self.exposed_inputs(HpBaseWorkChain))
-            inputs.clean_workdir = self.inputs.clean_workdir
-            inputs.hp.parameters = inputs.hp.parameters.get_dict()
-            inputs.hp.parameters['INPUTHP']['start_q'] = qpoint_index + 1 # QuantumESPRESSO starts from 1
-            inputs.hp.parameters['INPUTHP']['last_q'] = qpoint_index + 1
-            inputs.hp.parameters = orm.Dict(dict=inputs.hp.parameters)
+
+            qpoint = qpoint_index + 1 # QuantumESPRESSO starts from 1
+            parameters = {**base_parameters, 'INPUTHP': {**base_inputhp, 'start_q': qpoint, 'last_q': qpoint}}
+
+            inputs = AttributeDict(base_inputs)
+            inputs.hp = AttributeDict(base_inputs.hp)
+            inputs.hp.parameters = orm.Dict(parameters)
+            inputs.metadata = AttributeDict(base_inputs.metadata)
             inputs.metadata.call_link_label = key
 
             node = self.submit(HpBaseWorkChain, **inputs)
-            self.to_context(**{key: node})
-            name = HpBaseWorkChain.__name__
-            self.report(f'launched {name}<{node.pk}> for q point {qpoint_index}')
+            running[key] = node
+            launched.append(f'{HpBaseWorkChain.__name__}<{node.pk}> for q point {qpoint_index}')
+
+        # A single report for all children, since every report is written to the database as a separate log entry
+        self.report(f"launched {', '.join(launched)}")
+        self.to_context(**running)
+        self.ctx.qpoint_keys.extend(running)
 
     def inspect_qpoints(self):
         """Inspect each parallel qpoint `HpBaseWorkChain`."""
-        for key, workchain in self.ctx.items():
-            if key.startswith('qpoint_'):
-                if not workchain.is_finished_ok:
-                    self.report(f'child work chain {workchain} failed with status {workchain.exit_status}, aborting.')
-                    return self.exit_codes.ERROR_QPOINT_WORKCHAIN_FAILED
+        for key in self.ctx.qpoint_keys:
+            workchain = self.ctx[key]
+            if not workchain.is_finished_ok:
+                self.report(f'child work chain {workchain} failed with status {workchain.exit_status}, aborting.')
+                return self.exit_codes.ERROR_QPOINT_WORKCHAIN_FAILED
 
     def run_final(self):
         """Perform the final HpCalculation to collect the various components of the chi matrices."""
         inputs = AttributeDict(self.exposed_inputs(HpBaseWorkChain))
         inputs.hp.parent_scf = inputs.hp.parent_scf
-        inputs.hp.parent_hp = {key: wc.outputs.retrieved for key, wc in self.ctx.items() if key.startswith('qpoint_')}
+
+        # Fetch the ``retrieved`` outputs of all children with a single query, instead of resolving them one by one
+        keys = {self.ctx[key].pk: key for key in self.ctx.qpoint_keys}
+        filters = {'id': {'in': list(keys)}}
+        query = orm.QueryBuilder().append(orm.WorkflowNode, filters=filters, tag='child', project='id')
+        query.append(orm.FolderData, with_incoming='child', edge_filters={'label': 'retrieved'}, project='*')
+        inputs.hp.parent_hp = {keys[pk]: retrieved for pk, retrieved in query.iterall()}
+
+        missing = [key for key in keys.values() if key not in inputs.hp.parent_hp]
+        if missing:
+            self.report(f'the child work chains {missing} did not return the `retrieved` output, aborting.')
+            return self.exit_codes.ERROR_CHILD_RETRIEVED_MISSING
+
         inputs.hp.metadata.options.max_wallclock_seconds = 3600 # 1 hour is more than enough
         inputs.metadata.call_link_label = 'compute_chi'
 
@@ -148,15 +182,7 @@ class HpParallelizeQpointsWorkChain(WorkChain):
             self.report('remote folders will not be cleaned')
             return
 
-        cleaned_calcs = []
-
-        for called_descendant in self.node.called_descendants:
-            if isinstance(called_descendant, orm.CalcJobNode):
-                try:
-                    called_descendant.outputs.remote_folder._clean()  # pylint: disable=protected-access
-                    cleaned_calcs.append(called_descendant.pk)
-                except (IOError, OSError, KeyError):
-                    pass
+        cleaned_calcs = clean_remote_folders(self.node)
 
         if cleaned_calcs:
             self.report(f"cleaned remote folders of calculations: {' '.join(map(str, cleaned_calcs))}")
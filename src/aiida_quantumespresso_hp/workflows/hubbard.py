@@ -2,6 +2,11 @@
 """Turn-key solution to automatically compute the self-consistent Hubbard parameters for a given structure."""
 from __future__ import annotations
 
+import copy
+from functools import cached_property
+from itertools import compress
+import re
+
 from aiida import orm
 from aiida.common.extendeddicts import AttributeDict
 from aiida.engine import ToContext, WorkChain, append_, if_, while_
@@ -14,7 +19,7 @@ import numpy as np
 
 from aiida_quantumespresso_hp.calculations.functions.structure_relabel_kinds import structure_relabel_kinds
 from aiida_quantumespresso_hp.calculations.functions.structure_reorder_kinds import structure_reorder_kinds
-from aiida_quantumespresso_hp.utils.general import set_tot_magnetization
+from aiida_quantumespresso_hp.utils.general import clean_remote_folders, set_tot_magnetization
 
 HubbardStructureData = DataFactory('quantumespresso.hubbard_structure')
 
@@ -24,6 +29,8 @@ PwBaseWorkChain = WorkflowFactory('quantumespresso.pw.base')
 PwRelaxWorkChain = WorkflowFactory('quantumespresso.pw.relax')
 HpWorkChain = WorkflowFactory('quantumespresso.hp.main')
 
+_DIGIT_RE = re.compile(r'\d')
+
 
 def get_separated_parameters(
     hubbard_parameters: list[tuple[int, str, int, str, float, tuple[int, int, int], str]]
@@ -32,18 +39,34 @@ def get_separated_parameters(
 
     :return: tuple (list of onsites, list of intersites).
     """
-    onsites = []
-    intersites = []
+    mask = [parameters[0] == parameters[2] and parameters[1] == parameters[3] for parameters in hubbard_parameters]
 
-    for parameters in hubbard_parameters:
-        if parameters[0] == parameters[2] and parameters[1] == parameters[3]:
-            onsites.append(parameters)
-        else:
-            intersites.append(parameters)
+    onsites = list(compress(hubbard_parameters, mask))
+    intersites = list(compress(hubbard_parameters, [not is_onsite for is_onsite in mask]))
 
     return onsites, intersites
 
 
+def is_reordering_trivial(hubbard_structure: HubbardStructureData) -> bool:
+    """Return whether reordering the kinds for ``hp.x`` would leave the sites and kinds of the structure unchanged.
+
+    This can be the case even if ``HubbardUtils.is_to_reorder`` returns ``True``, for example when the Hubbard
+    parameters only involve some of the sites of a kind that already comes first.
+    """
+    from aiida_quantumespresso.utils.hubbard import get_hubbard_indices
+
+    site_kind_names = hubbard_structure.get_site_kindnames()
+    hubbard_kind_names = {site_kind_names[index] for index in get_hubbard_indices(hubbard_structure.hubbard)}
+
+    # Same order as ``HubbardUtils.reorder_atoms``: the Hubbard kinds in reverse alphabetical order, then the others.
+    reordered = []
+    for kind_name in sorted(hubbard_kind_names, reverse=True):
+        reordered.extend(name for name in site_kind_names if name == kind_name)
+    reordered.extend(name for name in site_kind_names if name not in hubbard_kind_names)
+
+    return reordered == site_kind_names and list(dict.fromkeys(reordered)) == hubbard_structure.get_kind_names()
+
+
 def validate_positive(value, _):
     """Validate that the value is positive."""
     if value.value < 0:
@@ -52,11 +75,11 @@ def validate_positive(value, _):
 
 def validate_inputs(inputs, _):
     """Validate the entire inputs."""
-    parameters = AttributeDict(inputs).scf.pw.parameters.get_dict()
-    nspin = parameters.get('SYSTEM', {}).get('nspin', 1)
+    system = inputs['scf']['pw']['parameters'].get('SYSTEM', {})
+    nspin = system.get('nspin', 1)
 
     if nspin == 2:
-        magnetic_moments = parameters.get('SYSTEM', {}).get('starting_magnetization', None)
+        magnetic_moments = system.get('starting_magnetization', None)
         if magnetic_moments is None:
             return 'Missing `starting_magnetization` input in `scf.pw.parameters` while `nspin == 2`.'
 
@@ -269,6 +292,7 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
         # Set ctx variables for the cycle.
         self.ctx.current_magnetic_moments = None  # starting_magnetization dict for collinear spin calcs
         self.ctx.max_iterations = self.inputs.max_iterations.value
+        self.ctx.meta_convergence = self.inputs.meta_convergence.value
         self.ctx.is_converged = False
         self.ctx.is_insulator = None
         self.ctx.is_magnetic = False
@@ -282,14 +306,14 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
 
         # Check if the atoms should be reordered
         hp_utils = HubbardUtils(self.inputs.hubbard_structure)
-        if not hp_utils.is_to_reorder():
+        if not hp_utils.is_to_reorder() or is_reordering_trivial(self.inputs.hubbard_structure):
             self.ctx.current_hubbard_structure = self.inputs.hubbard_structure
         else:
             self.report('detected kinds in the wrong order: reordering the kinds.')
             self.ctx.current_hubbard_structure = structure_reorder_kinds(self.inputs.hubbard_structure)
 
         # Determine whether the system is to be treated as magnetic
-        parameters = self.inputs.scf.pw.parameters.get_dict()
+        parameters = self._scf_parameters
         nspin = parameters.get('SYSTEM', {}).get('nspin', self.defaults.qe.nspin)
         magnetic_moments = parameters.get('SYSTEM', {}).get('starting_magnetization', None)
 
@@ -323,7 +347,7 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
 
     def should_check_convergence(self):
         """Return whether to check the convergence of Hubbard parameters."""
-        if not self.inputs.meta_convergence.value:
+        if not self.ctx.meta_convergence:
             return False
 
         if self.ctx.iteration <= self.ctx.skip_relax_iterations:
@@ -366,7 +390,7 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
             return self.exit_codes.ERROR_FAILED_TO_DETERMINE_PSEUDO_POTENTIAL
 
         if cls is PwBaseWorkChain and namespace == 'scf':
-            inputs = self.set_pw_parameters(inputs)
+            inputs = self.set_pw_parameters(inputs, self._scf_parameters)
             inputs.pw.pseudos = pseudos
             inputs.pw.structure = self.ctx.current_hubbard_structure
 
@@ -379,15 +403,34 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
 
         return inputs
 
-    def set_pw_parameters(self, inputs):
+    @cached_property
+    def _scf_parameters(self) -> dict:
+        """Return the content of the ``scf.pw.parameters`` input, which is only copied once from the database.
+
+        .. note:: this is not to be modified in place. Use ``set_pw_parameters`` to get a copy with new namelists.
+        """
+        return self.inputs.scf.pw.parameters.get_dict()
+
+    def set_pw_parameters(self, inputs, parameters: dict | None = None):
         """Set the input parameters for a generic `quantumespresso.pw` calculation.
 
         :param inputs: AttributeDict of a ``PwBaseWorkChain`` builder input.
+        :param parameters: optional template of the parameters, by default the ``pw.parameters`` of ``inputs``. The
+            template is deep copied, so the returned parameters can be modified in place without affecting it.
         """
-        parameters = inputs.pw.parameters.get_dict()
-        parameters.setdefault('CONTROL', {})
-        parameters.setdefault('SYSTEM', {})
-        parameters.setdefault('ELECTRONS', {})
+        namelists = ('CONTROL', 'SYSTEM', 'ELECTRONS')
+
+        if parameters is None:
+            # Nothing to change, so the input node can be passed on as is instead of creating a new one.
+            if not self.ctx.current_magnetic_moments and all(key in inputs.pw.parameters for key in namelists):
+                return inputs
+
+            parameters = inputs.pw.parameters.get_dict()
+        else:
+            parameters = copy.deepcopy(parameters)
+
+        for key in namelists:
+            parameters.setdefault(key, {})
 
         if self.ctx.current_magnetic_moments:
             parameters['SYSTEM']['starting_magnetization'] = self.ctx.current_magnetic_moments.get_dict()
@@ -405,16 +448,20 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
 
         :return: dictionary of pseudos where the keys are the kindnames of ``self.ctx.current_hubbard_structure``.
         """
-        import re
-
         results = {}
-        pseudos = self.inputs.scf.pw.pseudos
+        grouped = {}
+
+        for key, pseudo in self.inputs.scf.pw.pseudos.items():
+            grouped.setdefault(_DIGIT_RE.sub('', key), []).append(pseudo)
 
         for kind in self.ctx.current_hubbard_structure.kinds:
-            for key, pseudo in pseudos.items():
-                symbol = re.sub(r'\d', '', key)
-                if re.match(fr'{kind.symbol}[0-9]*', symbol):
-                    results[kind.name] = pseudo
+            if kind.symbol in grouped:
+                results[kind.name] = grouped[kind.symbol][0]
+                continue
+
+            for symbol, candidates in grouped.items():
+                if symbol.startswith(kind.symbol):
+                    results[kind.name] = candidates[0]
                     break
             else:
                 raise ValueError(f'could not find the pseudo from inputs.scf.pw.pseudos for kind `{kind}`.')
@@ -425,17 +472,20 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
         """Relabel the Hubbard structure if new types have been detected."""
         from aiida_quantumespresso.utils.hubbard import is_intersite_hubbard
 
-        if not is_intersite_hubbard(workchain.outputs.hubbard_structure.hubbard):
-            for site in workchain.outputs.hubbard.dict.sites:
-                if not site['type'] == site['new_type']:
-                    result = structure_relabel_kinds(
-                        self.ctx.current_hubbard_structure, workchain.outputs.hubbard, self.ctx.current_magnetic_moments
-                    )
-                    self.ctx.current_hubbard_structure = result['hubbard_structure']
-                    if self.ctx.current_magnetic_moments is not None:
-                        self.ctx.current_magnetic_moments = result['starting_magnetization']
-                    self.report('new types have been detected: relabeling the structure.')
-                    return
+        # Checking the types first is cheaper, since it does not need to deserialize the ``Hubbard`` model.
+        if all(site['type'] == site['new_type'] for site in workchain.outputs.hubbard['sites']):
+            return
+
+        if is_intersite_hubbard(workchain.outputs.hubbard_structure.hubbard):
+            return
+
+        result = structure_relabel_kinds(
+            self.ctx.current_hubbard_structure, workchain.outputs.hubbard, self.ctx.current_magnetic_moments
+        )
+        self.ctx.current_hubbard_structure = result['hubbard_structure']
+        if self.ctx.current_magnetic_moments is not None:
+            self.ctx.current_magnetic_moments = result['starting_magnetization']
+        self.report('new types have been detected: relabeling the structure.')
 
     def run_relax(self):
         """Run the PwRelaxWorkChain to run a relax PwCalculation."""
@@ -472,7 +522,6 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
         parameters['ELECTRONS']['conv_thr'] = parameters['ELECTRONS'].get(
             'conv_thr', self.defaults.conv_thr_preconverge
         )
-        inputs.pw.parameters = orm.Dict(parameters)
         inputs.metadata.call_link_label = f'iteration_{self.ctx.iteration:02d}_scf_smearing'
 
         running = self.submit(PwBaseWorkChain, **inputs)
@@ -493,7 +542,7 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
 
         inputs = self.get_inputs(PwBaseWorkChain, 'scf')
 
-        nbnd = previous_parameters.get_dict()['number_of_bands']
+        nbnd = previous_parameters['number_of_bands']
         conv_thr = inputs.pw.parameters['ELECTRONS'].get('conv_thr', self.defaults.conv_thr_strictfinal)
 
         inputs.pw.parameters['CONTROL'].update({
@@ -515,12 +564,11 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
 
         # If magnetic, set the total magnetization and raises an error if is non (not close enough) integer.
         if self.ctx.is_magnetic:
-            total_magnetization = previous_parameters.get_dict()['total_magnetization']
+            total_magnetization = previous_parameters['total_magnetization']
             if not set_tot_magnetization(inputs.pw.parameters, total_magnetization):
                 return self.exit_codes.ERROR_NON_INTEGER_TOT_MAGNETIZATION.format(iteration=self.ctx.iteration)
 
         inputs.pw.parent_folder = previous_workchain.outputs.remote_folder
-        inputs.pw.parameters = orm.Dict(inputs.pw.parameters)
 
         if self.ctx.is_magnetic:
             inputs.metadata.call_link_label = f'iteration_{self.ctx.iteration:02d}_scf_fixed_magnetic'
@@ -551,10 +599,9 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
             return self.exit_codes.ERROR_SUB_PROCESS_FAILED_SCF.format(iteration=self.ctx.iteration)
 
         bands = workchain.outputs.output_band
-        parameters = workchain.outputs.output_parameters.get_dict()
-        # number_electrons = parameters['number_of_electrons']
+        # number_electrons = workchain.outputs.output_parameters['number_of_electrons']
         # is_insulator, _ = find_bandgap(bands, number_electrons=number_electrons)
-        fermi_energy = parameters['fermi_energy']
+        fermi_energy = workchain.outputs.output_parameters['fermi_energy']
         is_insulator, _ = find_bandgap(bands, fermi_energy=fermi_energy)
 
         if is_insulator:
@@ -596,7 +643,7 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
             self.ctx.current_hubbard_structure = workchain.outputs.hubbard_structure
             self.relabel_hubbard_structure(workchain)
 
-            if not self.inputs.meta_convergence:
+            if not self.ctx.meta_convergence:
                 self.report('meta convergence is switched off, so not checking convergence of Hubbard parameters.')
                 self.ctx.is_converged = True
 
@@ -605,15 +652,9 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
         workchain = self.ctx.workchains_hp[-1]
 
         # We store in memory the parameters before relabelling to make the comparison easier.
-        reference = self.ctx.current_hubbard_structure.clone()
-        ref_utils = HubbardUtils(reference)
-        ref_utils.reorder_atoms()
-        ref_params = reference.hubbard.to_list()
-
-        new_hubbard_structure = workchain.outputs.hubbard_structure.clone()
-        new_utils = HubbardUtils(reference)
-        new_utils.reorder_atoms()
-        new_params = new_hubbard_structure.hubbard.to_list()
+        # Both structures already have the Hubbard kinds first, so they do not need to be reordered.
+        ref_params = self.ctx.current_hubbard_structure.hubbard.to_list()
+        new_params = workchain.outputs.hubbard_structure.hubbard.to_list()
 
         # We check if new types were created, in which case we relabel the `HubbardStructureData`
         self.ctx.current_hubbard_structure = workchain.outputs.hubbard_structure
@@ -630,23 +671,23 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
         check_intersites = True
 
         # We do the check on the onsites first
-        old = np.array(ref_onsites, dtype='object')
-        new = np.array(new_onsites, dtype='object')
-        diff = np.abs(old[:, 4] - new[:, 4])
+        old = np.fromiter((parameters[4] for parameters in ref_onsites), dtype=np.float64)
+        new = np.fromiter((parameters[4] for parameters in new_onsites), dtype=np.float64)
+        max_difference = np.abs(old - new).max(initial=0.0)
 
-        if (diff > self.inputs.tolerance_onsite).any():
+        if max_difference > self.inputs.tolerance_onsite.value:
             check_onsites = False
-            self.report(f'Hubbard onsites parameters are not converged. Max difference is {diff.max()}.')
+            self.report(f'Hubbard onsites parameters are not converged. Max difference is {max_difference}.')
 
         # Then the intersites if present. It might be an "only U" calculation.
         if ref_intersites:
-            old = np.array(ref_intersites, dtype='object')
-            new = np.array(new_intersites, dtype='object')
-            diff = np.abs(old[:, 4] - new[:, 4])
+            old = np.fromiter((parameters[4] for parameters in ref_intersites), dtype=np.float64)
+            new = np.fromiter((parameters[4] for parameters in new_intersites), dtype=np.float64)
+            max_difference = np.abs(old - new).max(initial=0.0)
 
-            if (diff > self.inputs.tolerance_intersite).any():
+            if max_difference > self.inputs.tolerance_intersite.value:
                 check_onsites = False
-                self.report(f'Hubbard intersites parameters are not converged. Max difference is {diff.max()}.')
+                self.report(f'Hubbard intersites parameters are not converged. Max difference is {max_difference}.')
 
         if check_intersites and check_onsites:
             self.report('Hubbard parameters are converged. Stopping the cycle.')
@@ -668,15 +709,7 @@ class SelfConsistentHubbardWorkChain(WorkChain, ProtocolMixin):
 
     def clean_iteration(self):
         """Clean all work directiories of the current iteration."""
-        cleaned_calcs = []
-
-        for called_descendant in self.node.called_descendants:
-            if isinstance(called_descendant, orm.CalcJobNode):
-                try:
-                    called_descendant.outputs.remote_folder._clean()  # pylint: disable=protected-access
-                    cleaned_calcs.append(called_descendant.pk)
-                except (IOError, OSError, KeyError):
-                    pass
+        cleaned_calcs = clean_remote_folders(self.node)
 
         if cleaned_calcs:
             self.report(f"cleaned remote folders of calculations: {' '.join(map(str, cleaned_calcs))}")
@@ -175,3 +175,15 @@ def test_collect(fixture_sandbox_folder, generate_calc_job, generate_inputs_hp,
 
     assert sorted(fixture_sandbox_folder.get_content_list()) == sorted([filename_input])
     file_regression.check(input_written, encoding='utf-8', extension='.in')
+
+
+def test_subclass_prefix():
+    """Test that the output file and directory names follow the ``prefix`` of a subclass."""
+
+    class CustomHpCalculation(HpCalculation):  # pylint: disable=abstract-method
+        prefix = 'custom'
+
+    assert CustomHpCalculation.filename_output_hubbard == 'custom.Hubbard_parameters.dat'
+    assert CustomHpCalculation.filename_output_hubbard_chi == 'custom.chi.dat'
+    assert CustomHpCalculation.dirname_output_scf == os.path.join('out', 'custom.save')
+    assert HpCalculation.filename_output_hubbard == 'aiida.Hubbard_parameters.dat'
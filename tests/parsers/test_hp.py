@@ -281,3 +281,82 @@ def test_failed_calculation(
     assert calcfunction.is_finished, calcfunction.exception
     assert calcfunction.is_failed, calcfunction.exit_status
     assert calcfunction.exit_status == exit_status
+
+
+def test_failed_stdout_read(
+    monkeypatch, aiida_localhost, generate_calc_job_node, generate_parser, generate_inputs_default
+):
+    """Test that an I/O error while reading the stdout is reported as ``ERROR_OUTPUT_STDOUT_READ``."""
+    from aiida_quantumespresso_hp.parsers.parse_raw import hp as parse_raw_hp
+
+    def parse_raw_output(stdout):
+        raise OSError('failed to read the stdout')
+
+    monkeypatch.setattr(parse_raw_hp, 'parse_raw_output', parse_raw_output)
+
+    name = 'default'
+    entry_point_calc_job = 'quantumespresso.hp'
+    entry_point_parser = 'quantumespresso.hp'
+
+    node = generate_calc_job_node(entry_point_calc_job, aiida_localhost, name, generate_inputs_default())
+    parser = generate_parser(entry_point_parser)
+    _, calcfunction = parser.parse_from_node(node, store_provenance=False)
+
+    assert calcfunction.is_finished, calcfunction.exception
+    assert calcfunction.is_failed, calcfunction.exit_status
+    assert calcfunction.exit_status == node.process_class.exit_codes.ERROR_OUTPUT_STDOUT_READ.status
+
+
+def test_parse_hubbard_matrix():
+    """Test the `HpParser.parse_hubbard_matrix` method for a matrix whose rows are wrapped over multiple lines."""
+    from aiida_quantumespresso_hp.parsers.hp import HpParser
+
+    row = [float(value) for value in range(1, 10)]
+    data = []
+    for index in range(9):
+        values = [f'{value + index * 10:12.6f}' for value in row]
+        data.extend([' '.join(values[:8]) + '\n', values[8] + '\n', '\n'])
+
+    matrix = HpParser.parse_hubbard_matrix(data)
+
+    assert matrix.shape == (9, 9)
+    assert matrix[0].tolist() == row
+    assert matrix[8, 8] == 89.0
+    assert (HpParser.parse_hubbard_matrix([line.encode() for line in data]) == matrix).all()
+
+    with pytest.raises(ValueError):
+        HpParser.parse_hubbard_matrix(['1.0 2.0\n', '\n', '3.0\n'])
+
+
+def test_parse_hubbard_matrix_ragged():
+    """Test the `HpParser.parse_hubbard_matrix` method for rows whose total length matches a rectangular matrix."""
+    from aiida_quantumespresso_hp.parsers.hp import HpParser
+
+    data = ['1.0 2.0\n', '\n', '3.0\n', '\n', '4.0 5.0 6.0\n', '\n']
+
+    with pytest.raises(ValueError, match=r'the rows of the matrix do not all have the same length'):
+        HpParser.parse_hubbard_matrix(data)
+
+
+def test_parse_hubbard_matrix_overflow():
+    """Test the `HpParser.parse_hubbard_matrix` method for a matrix with a Fortran overflow entry."""
+    from aiida_quantumespresso_hp.parsers.hp import HpParser
+
+    data = ['1.0 2.0\n', '\n', '3.0 ******\n', '\n']
+
+    with pytest.raises(ValueError, match=r'cannot be converted to floats'):
+        HpParser.parse_hubbard_matrix(data)
+
+    with pytest.raises(ValueError, match=r'cannot be converted to floats'):
+        HpParser.parse_hubbard_matrix([line.encode() for line in data])
+
+
+def test_parse_raw_output_repeated_messages():
+    """Test that repeated messages in the stdout are only logged once, in the order they are first encountered."""
+    from aiida_quantumespresso_hp.parsers.parse_raw.hp import parse_raw_output
+
+    stdout = '\n'.join(['Warning: first'] * 1000 + ['Warning: second', 'Maximum CPU time exceeded'] * 2 + ['JOB DONE'])
+    _, logs = parse_raw_output(stdout)
+
+    assert logs['warning'] == ['Warning: first', 'Warning: second']
+    assert logs['error'] == ['ERROR_OUT_OF_WALLTIME']
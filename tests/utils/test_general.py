@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """Tests for the :mod:`aiida_quantumespresso_hp.utils.general` module."""
+import pytest
 
 
 def test_set_tot_magnetization():
@@ -43,3 +44,44 @@ def test_distribute_base_wcs():
     assert distribute_base_workchains(2, 2) == [1, 1]
     assert distribute_base_workchains(2, 3) == [2, 1]
     assert distribute_base_workchains(7, 5) == [1] * 5
+
+
+@pytest.mark.usefixtures('aiida_profile')
+def test_clean_remote_folders(fixture_localhost, tmp_path):
+    """Test the `clean_remote_folders` function."""
+    from aiida.common import LinkType
+    from aiida.orm import CalcJobNode, RemoteData, WorkflowNode
+
+    from aiida_quantumespresso_hp.utils.general import clean_remote_folders
+
+    def generate_process(node_class, caller, label, **kwargs):
+        node = node_class(**kwargs)
+        link_type = LinkType.CALL_CALC if isinstance(node, CalcJobNode) else LinkType.CALL_WORK
+        node.base.links.add_incoming(caller, link_type=link_type, link_label=label)
+        return node.store()
+
+    root = WorkflowNode().store()
+    child = generate_process(WorkflowNode, root, 'child')
+
+    calcjobs = []
+    dirpaths = []
+
+    for index, caller in enumerate((root, child, child)):
+        dirpath = tmp_path / f'calc_{index}'
+        dirpath.mkdir()
+        (dirpath / 'aiida.out').write_text('content')
+        dirpaths.append(dirpath)
+
+        calcjob = generate_process(CalcJobNode, caller, f'calc_{index}', computer=fixture_localhost)
+        remote_folder = RemoteData(remote_path=str(dirpath), computer=fixture_localhost)
+        remote_folder.base.links.add_incoming(calcjob, link_type=LinkType.CREATE, link_label='remote_folder')
+        remote_folder.store()
+        calcjobs.append(calcjob)
+
+    # A calculation without a remote folder should be skipped
+    generate_process(CalcJobNode, child, 'calc_without_remote', computer=fixture_localhost)
+
+    assert clean_remote_folders(root) == [calcjob.pk for calcjob in calcjobs]
+    assert all(not dirpath.exists() or not any(dirpath.iterdir()) for dirpath in dirpaths)
+    assert all(calcjob.outputs.remote_folder.base.extras.get(RemoteData.KEY_EXTRA_CLEANED) for calcjob in calcjobs)
+    assert clean_remote_folders(child) == [calcjob.pk for calcjob in calcjobs[1:]]
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=no-member,redefined-outer-name
 """Tests for the `HpParallelizeAtomsWorkChain` class."""
+from aiida import orm
 from plumpy import ProcessState
 import pytest
 
@@ -72,12 +73,17 @@ def test_run_atoms(generate_workchain_atoms, generate_hp_workchain_node):
     """Test `HpParallelizeAtomsWorkChain.run_atoms`."""
     process = generate_workchain_atoms()
     process.ctx.initialization = generate_hp_workchain_node()
-    output_params = process.ctx.initialization.outputs.parameters.get_dict()
-    process.ctx.hubbard_sites = list(output_params['hubbard_sites'].items())
+    process.inspect_init()
     process.run_atoms()
 
     assert 'atom_1' in process.ctx
     assert 'atom_2' in process.ctx
+    assert process.ctx.atom_keys == ['atom_1', 'atom_2']
+
+    # Each child should only perturb its own site, and share the remaining inputs
+    for key, index in (('atom_1', 1), ('atom_2', 2)):
+        parameters = orm.load_node(process.ctx[key].pk).inputs.hp.parameters.get_dict()['INPUTHP']
+        assert [name for name in parameters if name.startswith('perturb_only_atom')] == [f'perturb_only_atom({index})']
 
 
 @pytest.mark.usefixtures('aiida_profile')
@@ -88,8 +94,7 @@ def test_run_atoms_max_concurrent(generate_workchain_atoms, generate_hp_workchai
     """
     process = generate_workchain_atoms(max_concurrent_base_workchains=1)
     process.ctx.initialization = generate_hp_workchain_node()
-    output_params = process.ctx.initialization.outputs.parameters.get_dict()
-    process.ctx.hubbard_sites = list(output_params['hubbard_sites'].items())
+    process.inspect_init()
 
     assert process.should_run_atoms()
     process.run_atoms()
@@ -108,8 +113,7 @@ def test_run_atoms_with_qpoints(generate_workchain_atoms, generate_hp_workchain_
     """Test `HpParallelizeAtomsWorkChain.run_atoms` with q point parallelization."""
     process = generate_workchain_atoms()
     process.ctx.initialization = generate_hp_workchain_node()
-    output_params = process.ctx.initialization.outputs.parameters.get_dict()
-    process.ctx.hubbard_sites = list(output_params['hubbard_sites'].items())
+    process.inspect_init()
     process.run_atoms()
 
     # Don't know how to test something like the following
@@ -130,12 +134,25 @@ def test_inspect_init(generate_workchain_atoms, generate_hp_workchain_node):
 def test_inspect_atoms(generate_workchain_atoms, generate_hp_workchain_node):
     """Test `HpParallelizeAtomsWorkChain.inspect_atoms`."""
     process = generate_workchain_atoms()
+    process.ctx.initialization = generate_hp_workchain_node()
+    process.inspect_init()
+    process.run_atoms()
     process.ctx.atom_1 = generate_hp_workchain_node(exit_status=300)
 
     result = process.inspect_atoms()
     assert result == HpParallelizeAtomsWorkChain.exit_codes.ERROR_ATOM_WORKCHAIN_FAILED
 
 
+@pytest.mark.usefixtures('aiida_profile')
+def test_inspect_atoms_none_launched(generate_workchain_atoms, generate_hp_workchain_node):
+    """Test `HpParallelizeAtomsWorkChain.inspect_atoms` when `run_atoms` was never called."""
+    process = generate_workchain_atoms()
+    process.ctx.initialization = generate_hp_workchain_node()
+    process.inspect_init()
+
+    assert process.inspect_atoms() is None
+
+
 @pytest.mark.usefixtures('aiida_profile')
 def test_inspect_final(generate_workchain_atoms, generate_hp_workchain_node):
     """Test `HpParallelizeAtomsWorkChain.inspect_final`."""
@@ -150,8 +167,27 @@ def test_inspect_final(generate_workchain_atoms, generate_hp_workchain_node):
 def test_run_final(generate_workchain_atoms, generate_hp_workchain_node):
     """Test `HpParallelizeAtomsWorkChain.run_final`."""
     process = generate_workchain_atoms()
+    process.ctx.initialization = generate_hp_workchain_node()
+    process.inspect_init()
+    process.run_atoms()
     process.ctx.atom_1 = generate_hp_workchain_node(use_retrieved=True)
+    process.ctx.atom_2 = generate_hp_workchain_node(use_retrieved=True)
 
     process.run_final()
 
     assert 'compute_hp' in process.ctx
+
+
+@pytest.mark.usefixtures('aiida_profile')
+def test_run_final_missing_retrieved(generate_workchain_atoms, generate_hp_workchain_node):
+    """Test `HpParallelizeAtomsWorkChain.run_final` when a child work chain did not return the `retrieved` output."""
+    process = generate_workchain_atoms()
+    process.ctx.initialization = generate_hp_workchain_node()
+    process.inspect_init()
+    process.run_atoms()
+    process.ctx.atom_1 = generate_hp_workchain_node(use_retrieved=True)
+    process.ctx.atom_2 = generate_hp_workchain_node()
+
+    result = process.run_final()
+    assert result == HpParallelizeAtomsWorkChain.exit_codes.ERROR_CHILD_RETRIEVED_MISSING
+    assert 'compute_hp' not in process.ctx
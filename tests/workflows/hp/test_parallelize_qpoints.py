@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # pylint: disable=no-member,redefined-outer-name
 """Tests for the `HpParallelizeQpointsWorkChain` class."""
+from aiida import orm
 from plumpy import ProcessState
 import pytest
 
@@ -77,13 +78,17 @@ def test_run_qpoints(generate_workchain_qpoints, generate_hp_workchain_node):
     """Test `HpParallelizeQpointsWorkChain.run_qpoints`."""
     process = generate_workchain_qpoints()
     process.ctx.initialization = generate_hp_workchain_node()
-    process.ctx.qpoints = list(range(process.ctx.initialization.outputs.parameters.dict.number_of_qpoints))
+    process.inspect_init()
 
     process.run_qpoints()
     # to keep consistency with QE we start from 1
     assert 'qpoint_1' in process.ctx
     assert 'qpoint_2' in process.ctx
 
+    for key, index in (('qpoint_1', 1), ('qpoint_2', 2)):
+        parameters = orm.load_node(process.ctx[key].pk).inputs.hp.parameters.get_dict()['INPUTHP']
+        assert parameters['start_q'] == parameters['last_q'] == index
+
 
 @pytest.mark.usefixtures('aiida_profile')
 def test_run_qpoints_max_concurrent(generate_workchain_qpoints, generate_hp_workchain_node):
@@ -93,7 +98,7 @@ def test_run_qpoints_max_concurrent(generate_workchain_qpoints, generate_hp_work
     """
     process = generate_workchain_qpoints(max_concurrent_base_workchains=1)
     process.ctx.initialization = generate_hp_workchain_node()
-    process.ctx.qpoints = list(range(process.ctx.initialization.outputs.parameters.dict.number_of_qpoints))
+    process.inspect_init()
 
     assert process.should_run_qpoints()
     process.run_qpoints()
@@ -104,6 +109,7 @@ def test_run_qpoints_max_concurrent(generate_workchain_qpoints, generate_hp_work
     process.run_qpoints()
     assert 'qpoint_1' in process.ctx
     assert 'qpoint_2' in process.ctx
+    assert process.ctx.qpoint_keys == ['qpoint_1', 'qpoint_2']
     assert not process.should_run_qpoints()
 
 
@@ -121,12 +127,25 @@ def test_inspect_init(generate_workchain_qpoints, generate_hp_workchain_node):
 def test_inspect_qpoints(generate_workchain_qpoints, generate_hp_workchain_node):
     """Test `HpParallelizeQpointsWorkChain.inspect_qpoints`."""
     process = generate_workchain_qpoints()
+    process.ctx.initialization = generate_hp_workchain_node()
+    process.inspect_init()
+    process.run_qpoints()
     process.ctx.qpoint_1 = generate_hp_workchain_node(exit_status=300)
 
     result = process.inspect_qpoints()
     assert result == HpParallelizeQpointsWorkChain.exit_codes.ERROR_QPOINT_WORKCHAIN_FAILED
 
 
+@pytest.mark.usefixtures('aiida_profile')
+def test_inspect_qpoints_none_launched(generate_workchain_qpoints, generate_hp_workchain_node):
+    """Test `HpParallelizeQpointsWorkChain.inspect_qpoints` when `run_qpoints` was never called."""
+    process = generate_workchain_qpoints()
+    process.ctx.initialization = generate_hp_workchain_node()
+    process.inspect_init()
+
+    assert process.inspect_qpoints() is None
+
+
 @pytest.mark.usefixtures('aiida_profile')
 def test_inspect_final(generate_workchain_qpoints, generate_hp_workchain_node):
     """Test `HpParallelizeQpointsWorkChain.inspect_final`."""
@@ -141,9 +160,27 @@ def test_inspect_final(generate_workchain_qpoints, generate_hp_workchain_node):
 def test_run_final(generate_workchain_qpoints, generate_hp_workchain_node):
     """Test `HpParallelizeQpointsWorkChain.run_final`."""
     process = generate_workchain_qpoints()
+    process.ctx.initialization = generate_hp_workchain_node()
+    process.inspect_init()
+    process.run_qpoints()
     process.ctx.qpoint_1 = generate_hp_workchain_node(use_retrieved=True)
     process.ctx.qpoint_2 = generate_hp_workchain_node(use_retrieved=True)
 
     process.run_final()
 
     assert 'compute_chi' in process.ctx
+
+
+@pytest.mark.usefixtures('aiida_profile')
+def test_run_final_missing_retrieved(generate_workchain_qpoints, generate_hp_workchain_node):
+    """Test `HpParallelizeQpointsWorkChain.run_final` when a child work chain did not return the `retrieved` output."""
+    process = generate_workchain_qpoints()
+    process.ctx.initialization = generate_hp_workchain_node()
+    process.inspect_init()
+    process.run_qpoints()
+    process.ctx.qpoint_1 = generate_hp_workchain_node(use_retrieved=True)
+    process.ctx.qpoint_2 = generate_hp_workchain_node()
+
+    result = process.run_final()
+    assert result == HpParallelizeQpointsWorkChain.exit_codes.ERROR_CHILD_RETRIEVED_MISSING
+    assert 'compute_chi' not in process.ctx
@@ -101,6 +101,18 @@ def generate_hp_workchain_node(generate_hubbard_structure):
     return _generate_hp_workchain_node
 
 
+def test_get_separated_parameters():
+    """Test the `get_separated_parameters` function."""
+    from aiida_quantumespresso_hp.workflows.hubbard import get_separated_parameters
+
+    onsite = (0, '3d', 0, '3d', 5.0, (0, 0, 0), 'U')
+    intersite = (0, '3d', 1, '2p', 1.0, (0, 0, 0), 'V')
+    intrasite = (0, '3d', 0, '2p', 0.5, (0, 0, 0), 'V')
+
+    assert get_separated_parameters([]) == ([], [])
+    assert get_separated_parameters([onsite, intersite, intrasite]) == ([onsite], [intersite, intrasite])
+
+
 @pytest.mark.parametrize(('parameters', 'match'), (({
     'nspin': 2
 }, r'Missing `starting_magnetization` input in `scf.pw.parameters` while `nspin == 2`.'), ({
@@ -164,6 +176,23 @@ def test_reorder_atoms_setup(generate_workchain_hubbard, generate_inputs_hubbard
     assert process.ctx.current_hubbard_structure != inputs['hubbard_structure']
 
 
+@pytest.mark.usefixtures('aiida_profile')
+def test_trivial_reorder_atoms_setup(generate_workchain_hubbard, generate_inputs_hubbard, generate_structure):
+    """Test `SelfConsistentHubbardWorkChain.setup` when reordering would not change the structure."""
+    from aiida_quantumespresso.data.hubbard_structure import HubbardStructureData
+
+    structure = generate_structure(structure_id='AFMlicoo2')
+    hubbard_structure = HubbardStructureData.from_structure(structure=structure)
+    hubbard_structure.append_hubbard_parameter(1, '3d', 1, '3d', 5.0)
+
+    inputs = generate_inputs_hubbard()
+    inputs['hubbard_structure'] = hubbard_structure
+    process = generate_workchain_hubbard(inputs=inputs)
+    process.setup()
+
+    assert process.ctx.current_hubbard_structure == inputs['hubbard_structure']
+
+
 @pytest.mark.usefixtures('aiida_profile')
 def test_magnetic_setup(generate_workchain_hubbard, generate_inputs_hubbard):
     """Test `SelfConsistentHubbardWorkChain.setup` for magnetic systems."""
@@ -365,6 +394,27 @@ def test_outline(
     assert process.outputs['hubbard_structure'] == process.ctx.workchains_hp[-1].outputs['hubbard_structure']
 
 
+@pytest.mark.usefixtures('aiida_profile')
+def test_scf_parameters_not_shared(generate_workchain_hubbard, generate_inputs_hubbard, generate_scf_workchain_node):
+    """Test that consecutive scf steps do not share the parameters they modify."""
+    from aiida.orm import load_node
+
+    inputs = generate_inputs_hubbard()
+    parameters = inputs['scf']['pw']['parameters'].get_dict()
+    process = generate_workchain_hubbard(inputs=inputs)
+    process.setup()
+
+    process.ctx.workchains_scf = [generate_scf_workchain_node(remote_folder=True)]
+    fixed = load_node(process.run_scf_fixed()['workchains_scf'].pk).inputs.pw.parameters.get_dict()
+    smearing = load_node(process.run_scf_smearing()['workchains_scf'].pk).inputs.pw.parameters.get_dict()
+
+    assert fixed['SYSTEM']['occupations'] == 'fixed'
+    assert smearing['SYSTEM']['occupations'] == 'smearing'
+    assert 'nbnd' not in smearing['SYSTEM']
+    assert 'startingpot' not in smearing['ELECTRONS']
+    assert process._scf_parameters == parameters  # pylint: disable=protected-access
+
+
 @pytest.mark.usefixtures('aiida_profile')
 def test_should_run_relax(generate_workchain_hubbard, generate_inputs_hubbard):
     """Test `SelfConsistentHubbardWorkChain.should_run_relax` method."""